@@ -0,0 +1,76 @@
+"""Event loop lag while parsing pages: synthetic CSES profile pages are parsed
+concurrently with the ParsingExecutor (inline, in threads and in processes),
+while a task that sleeps for 1ms measures how late the loop wakes it up.
+
+Run from the repository root: python -m bench.loop_lag"""
+
+import asyncio
+import statistics
+import time
+
+from cccrawl.crawlers.cses import CsesCrawler
+from cccrawl.crawlers.toolkit.parsing import ParsingExecutor
+
+PAGES = 10
+LINKS = 3000
+SAMPLE_INTERVAL = 0.001
+
+# Name: (max_workers, use_processes), as configured with PARSER_WORKERS and
+# PARSER_USE_PROCESSES.
+CONFIGURATIONS = {
+    "inline": (0, False),
+    "threads(2)": (2, False),
+    "processes(2)": (2, True),
+}
+
+
+def profile_page() -> bytes:
+    links = "".join(
+        f'<a href="/problemset/task/{1000 + i}/" class="{"full" if i % 2 else "zero"}">'
+        f"{i}</a>"
+        for i in range(LINKS)
+    )
+    return (
+        f"<html><body><table><tr><td>{links}</td></tr></table></body></html>".encode()
+    )
+
+
+async def sample_lag(lags: list[float], done: asyncio.Event) -> None:
+    while not done.is_set():
+        expected = time.monotonic() + SAMPLE_INTERVAL
+        await asyncio.sleep(SAMPLE_INTERVAL)
+        lags.append(max(0.0, time.monotonic() - expected))
+
+
+async def measure(parser: ParsingExecutor, page: bytes) -> list[float]:
+    lags: list[float] = []
+    done = asyncio.Event()
+    async with parser:
+        # Warm up the pool (processes are started lazily).
+        await parser.run(CsesCrawler._parse_profile_page, page)
+
+        sampler = asyncio.create_task(sample_lag(lags, done))
+        await asyncio.sleep(0.05)
+        await asyncio.gather(
+            *(parser.run(CsesCrawler._parse_profile_page, page) for _ in range(PAGES))
+        )
+        done.set()
+        await sampler
+    return lags
+
+
+def main() -> None:
+    page = profile_page()
+    print(f"{PAGES} CSES profile pages, {LINKS} links each ({len(page)} bytes)")
+    for name, (max_workers, use_processes) in CONFIGURATIONS.items():
+        parser = ParsingExecutor(max_workers, use_processes)
+        lags = asyncio.run(measure(parser, page))
+        p99 = statistics.quantiles(lags, n=100, method="inclusive")[98]
+        print(
+            f"{name:>14}: {len(lags):5d} samples, p99 lag {p99 * 1000:7.1f}ms, "
+            f"max lag {max(lags) * 1000:7.1f}ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
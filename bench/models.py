@@ -0,0 +1,99 @@
+"""Throughput of the model operations on the hot path of a crawl: building
+crawled submissions (and their ids) from a Codeforces submission history,
+converting them to full submissions, and serializing them for the database.
+
+Run from the repository root: python -m bench.models"""
+
+import time
+from collections.abc import Callable, Sequence
+from datetime import datetime, timezone
+from typing import Any
+
+from cccrawl.crawlers.codeforces import (
+    CodeforcesCrawledSubmission,
+    CodeforcesCrawler,
+    CodeforcesSubmission,
+)
+from cccrawl.db.fingerprints import document_fingerprint
+from cccrawl.integrations.codeforces import CodeforcesIntegration
+from cccrawl.models.problem import problem_catalog
+from cccrawl.models.submission import SubmissionVerdict
+
+SUBMISSIONS = 20_000
+PROBLEMS = 300
+ROUNDS = 3
+
+integration = CodeforcesIntegration(handle="tourist")
+
+# Submissions as returned by the user.status API.
+history = [
+    {
+        "id": i,
+        "contestId": 1 + i % PROBLEMS,
+        "problem": {"contestId": 1 + i % PROBLEMS, "index": "A"},
+        "verdict": "OK",
+        "creationTimeSeconds": 1_700_000_000 + i,
+    }
+    for i in range(SUBMISSIONS)
+]
+
+
+def crawl(submission: dict[str, Any]) -> CodeforcesCrawledSubmission:
+    """Equivalent to the body of CodeforcesCrawler.crawl."""
+    return CodeforcesCrawledSubmission(
+        integration=integration,
+        problem=problem_catalog.get(
+            CodeforcesCrawler._get_problem_url(submission["problem"])
+        ),
+        verdict=SubmissionVerdict.accepted,
+        submitted_at=datetime.fromtimestamp(
+            submission["creationTimeSeconds"], tz=timezone.utc
+        ),
+        submission_url=CodeforcesCrawler._get_submission_url(submission),
+    )
+
+
+def crawl_with_id(submission: dict[str, Any]) -> str:
+    return crawl(submission).id
+
+
+def serialize(submission: CodeforcesSubmission) -> bytes:
+    """Equivalent to CosmosDatabase.upsert_submission, up to the request."""
+    body = submission.model_dump(mode="json")
+    return document_fingerprint(body)
+
+
+def measure(
+    name: str, operation: Callable[[Any], Any], make_inputs: Callable[[], Sequence[Any]]
+) -> None:
+    """Prints the best throughput of the operation over a few rounds. Inputs
+    are created again for every round, so no ids are cached in advance."""
+    best = 0.0
+    for _ in range(ROUNDS):
+        inputs = make_inputs()
+        started_at = time.perf_counter()
+        for item in inputs:
+            operation(item)
+        best = max(best, len(inputs) / (time.perf_counter() - started_at))
+    print(f"{name:<28} {best:>10,.0f} submissions/s")
+
+
+def main() -> None:
+    measure("crawl + id", crawl_with_id, lambda: history)
+    measure(
+        "from_crawled",
+        CodeforcesSubmission.from_crawled,
+        lambda: [crawl(submission) for submission in history],
+    )
+    measure(
+        "dump + fingerprint",
+        serialize,
+        lambda: [
+            CodeforcesSubmission.from_crawled(crawl(submission))
+            for submission in history
+        ],
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+import asyncio
+import json
+from http import HTTPStatus
+from logging import getLogger
+from pathlib import Path
+from types import TracebackType
+from typing import Any, Self
+
+from cccrawl.manager import MainCrawler
+from cccrawl.models.base import ModelId
+
+logger = getLogger(__name__)
+
+# Maximal time (in seconds) for reading a request and writing the response.
+REQUEST_TIMEOUT = 10
+
+
+class ControlServer:
+    """A minimal HTTP API for controlling a running crawler, intended for local
+    access only (on a loopback address, or on a Unix socket):
+
+    POST /crawl/<integration id>  crawl the integration as soon as possible
+    GET /status                   report the current state of the crawler
+
+    The address is either 'host:port', or 'unix:<path>' for a Unix socket."""
+
+    def __init__(self, crawler: MainCrawler, address: str) -> None:
+        self._crawler = crawler
+        self._address = address
+        self._server: asyncio.Server | None = None
+
+    async def __aenter__(self) -> Self:
+        if self._address.startswith("unix:"):
+            path = self._address.removeprefix("unix:")
+            self._server = await asyncio.start_unix_server(self._handle, path)
+        else:
+            host, _, port = self._address.rpartition(":")
+            self._server = await asyncio.start_server(
+                self._handle, host or "127.0.0.1", int(port)
+            )
+        logger.info("Control API listening on %s", self._address)
+        return self
+
+    async def __aexit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        if self._address.startswith("unix:"):
+            Path(self._address.removeprefix("unix:")).unlink(missing_ok=True)
+
+    async def _handle(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        try:
+            async with asyncio.timeout(REQUEST_TIMEOUT):
+                try:
+                    method, path = await self._read_request(reader)
+                except ValueError:
+                    status, body = HTTPStatus.BAD_REQUEST, {"error": "bad request"}
+                else:
+                    status, body = self._route(method, path)
+                await self._write_response(writer, status, body)
+        except (TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def _read_request(reader: asyncio.StreamReader) -> tuple[str, str]:
+        request_line = await reader.readline()
+        method, path, _ = request_line.decode("latin-1").split(" ", 2)
+
+        # Headers (and body) are ignored.
+        while await reader.readline() not in (b"\r\n", b"\n", b""):
+            pass
+        return method, path
+
+    def _route(self, method: str, path: str) -> tuple[HTTPStatus, Any]:
+        segments = [segment for segment in path.split("?")[0].split("/") if segment]
+        match segments:
+            case ["status"]:
+                if method != "GET":
+                    return HTTPStatus.METHOD_NOT_ALLOWED, {"error": "use GET"}
+                status = self._crawler.status()
+                return HTTPStatus.OK, {
+                    **status._asdict(),
+                    "current_since": (
+                        status.current_since.isoformat()
+                        if status.current_since is not None
+                        else None
+                    ),
+                }
+            case ["crawl", integration_id]:
+                if method != "POST":
+                    return HTTPStatus.METHOD_NOT_ALLOWED, {"error": "use POST"}
+                position = self._crawler.request_crawl(ModelId(integration_id))
+                logger.info(
+                    "Crawl of integration %s requested (position %d)",
+                    integration_id,
+                    position,
+                )
+                return HTTPStatus.ACCEPTED, {
+                    "integration": integration_id,
+                    "position": position,
+                }
+            case _:
+                return HTTPStatus.NOT_FOUND, {"error": "not found"}
+
+    @staticmethod
+    async def _write_response(
+        writer: asyncio.StreamWriter, status: HTTPStatus, body: Any
+    ) -> None:
+        payload = json.dumps(body).encode("utf8")
+        head = (
+            f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+            "Content-Type: application/json\r\n"
+            f"Content-Length: {len(payload)}\r\n"
+            "Connection: close\r\n"
+            "\r\n"
+        )
+        writer.write(head.encode("latin-1") + payload)
+        await writer.drain()
@@ -1,3 +1,21 @@
-from .base import Crawler
-from .codeforces import CodeforcesCrawler
-from .cses import CsesCrawler
+from importlib import import_module
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+    from .base import Crawler
+    from .codeforces import CodeforcesCrawler
+    from .cses import CsesCrawler
+
+# Crawlers are imported lazily, on first access, since some of them pull
+# heavy parsing dependencies.
+_lazy_exports = {
+    "Crawler": ".base",
+    "CodeforcesCrawler": ".codeforces",
+    "CsesCrawler": ".cses",
+}
+
+
+def __getattr__(name: str) -> Any:
+    if name not in _lazy_exports:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    return getattr(import_module(_lazy_exports[name], __name__), name)
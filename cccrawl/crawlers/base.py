@@ -1,10 +1,13 @@
 from abc import ABC, abstractmethod
 from collections.abc import AsyncIterable
 from logging import getLogger
-from typing import Any, Generic, TypeAlias, TypeVar
+from typing import Any, ClassVar, Generic, Self, TypeAlias, TypeVar
+
+from httpx import AsyncClient
 
 from cccrawl.crawlers.toolkit import CrawlerToolkit
-from cccrawl.models.integration import Integration
+from cccrawl.crawlers.toolkit.http import HttpClientSettings
+from cccrawl.models.integration import Integration, Platform
 from cccrawl.models.submission import CrawledSubmission, Submission
 
 IntegrationT = TypeVar("IntegrationT", bound=Integration)
@@ -15,14 +18,45 @@ logger = getLogger(__name__)
 
 
 class Crawler(ABC, Generic[IntegrationT, CrawledSubmissionT, SubmissionT]):
+    platform: ClassVar[Platform]
+
+    # Settings of the HTTP client that is dedicated to the crawler's platform.
+    http_client_settings: ClassVar[HttpClientSettings] = HttpClientSettings()
+
     def __init__(self, toolkit: CrawlerToolkit) -> None:
         self._toolkit = toolkit
 
+    @classmethod
+    def from_env(cls, toolkit: CrawlerToolkit) -> Self:
+        """Create a crawler instance, reading any additional configuration it
+        requires from the environment variables."""
+        return cls(toolkit)
+
+    @property
+    def _client(self) -> AsyncClient:
+        return self._toolkit.clients.get(self.platform)
+
     async def load(self) -> None:
         """An ASYNC alternative to __init__. Will called (awaited) once, at
         startup of the program, after initialization of an instance but before
         the crawling starts."""
 
+    async def index_integrations(self, integrations: list[IntegrationT]) -> None:
+        """Called (awaited) once, at startup of the crawling, with all stored
+        integrations of the crawler's platform, before any of them is crawled.
+        Used to restore in-memory indexes of the integrations after a restart."""
+
+    async def should_crawl(self, integration: IntegrationT) -> bool:
+        """Called (awaited) before an integration is crawled, and before any of
+        its stored submissions are read. Returns False if the integration
+        certainly has no new submissions, to skip the crawl entirely. Should
+        be cheap compared to the crawl itself."""
+        return True
+
+    async def close(self) -> None:
+        """Called (awaited) once, when the program shuts down, to persist any
+        state that should survive a restart and to stop background tasks."""
+
     @abstractmethod
     def crawl(self, integration: IntegrationT) -> AsyncIterable[CrawledSubmissionT]:
         """Provided an integration, this method should crawl a subset of the
@@ -1,29 +1,39 @@
+import asyncio
 import html
+import json
+import os
+import time
 from collections.abc import AsyncIterable
 from datetime import datetime, timezone
+from enum import auto
+from functools import cached_property
 from io import StringIO
 from logging import getLogger
-from typing import Any
+from typing import Any, NamedTuple, Self
 
 import backoff
 from bs4 import BeautifulSoup
 from httpx import HTTPError, Response
-from limited import AsyncLimiter
 from pydantic import AwareDatetime, HttpUrl, computed_field
 
 from cccrawl.crawlers.base import Crawler
 from cccrawl.crawlers.error import CrawlerError
+from cccrawl.crawlers.toolkit import CrawlerToolkit
+from cccrawl.crawlers.toolkit.http import HttpClientSettings
+from cccrawl.crawlers.toolkit.limits import SharedLimiter
 from cccrawl.files.base import FileUploadError
 from cccrawl.integrations.codeforces import CodeforcesIntegration
-from cccrawl.models.base import ModelId
-from cccrawl.models.problem import Problem
+from cccrawl.models.base import CCBaseStrEnum, ModelId
+from cccrawl.models.integration import Platform
+from cccrawl.models.problem import problem_catalog
 from cccrawl.models.submission import CrawledSubmission, Submission, SubmissionVerdict
+from cccrawl.utils import current_datetime
 
 logger = getLogger(__name__)
 
 
-codeforces_api_limits = AsyncLimiter(limit=3, every=3)
-codeforces_html_limits = AsyncLimiter(limit=1, every=10)
+codeforces_api_limits = SharedLimiter("codeforces-api", limit=3, every=3)
+codeforces_html_limits = SharedLimiter("codeforces-html", limit=1, every=10)
 backoff_on_exception = backoff.on_exception(
     # CODEFORCES is very strict. When getting 403, it takes a while (sometimes
     # a couple of minutes) to return back to normal accepting state! We should
@@ -35,12 +45,53 @@ backoff_on_exception = backoff.on_exception(
 )
 
 
+# Number of submissions requested from the recent status feed (the API maximum).
+RECENT_STATUS_COUNT = 1000
+
+# Number of handles checked in a single user.info request.
+USER_INFO_BATCH_SIZE = 300
+
+
+class CodeforcesDiscoveryMode(CCBaseStrEnum):
+    """How the crawler discovers that a Codeforces user has new submissions."""
+
+    # Download the submission history of every user, on every crawl.
+    per_user = auto()
+
+    # Poll the global feed of recent submissions (problemset.recentStatus), and
+    # download the history only of users that appear in it. The history of
+    # every user is still downloaded once every sweep interval, for
+    # submissions that do not appear in the feed (for example, gym submissions).
+    feed = auto()
+
+    # Check when users were last online, in batches of many users per request
+    # (user.info), and download the history only of users that were online
+    # since it was last downloaded. The history of every user is still
+    # downloaded once every sweep interval.
+    activity = auto()
+
+
+class RecentSubmission(NamedTuple):
+    """A submission parsed from the recent status feed."""
+
+    id: int
+    handles: list[str]  # lowercase handles of the author (all team members)
+    judged: bool
+
+
+class UserActivity(NamedTuple):
+    """The activity of a user, as reported by user.info."""
+
+    last_online_at: float  # unix timestamp
+    checked_at: float  # unix timestamp of the user.info request
+
+
 class CodeforcesCrawledSubmission(CrawledSubmission[CodeforcesIntegration]):
     submitted_at: AwareDatetime
     submission_url: HttpUrl
 
     @computed_field  # type: ignore[misc]
-    @property
+    @cached_property
     def id(self) -> ModelId:
         return ModelId(
             self._hash_tokens(
@@ -66,10 +117,95 @@ class CodeforcesCrawler(
         CodeforcesSubmission,
     ]
 ):
+    platform = Platform.codeforces
+
+    # Sized to the limiters: at most 3 API requests every 3 seconds, and a
+    # single HTML request every 10 seconds.
+    http_client_settings = HttpClientSettings(
+        max_connections=4,
+        max_keepalive_connections=4,
+        keepalive_expiry=60,
+    )
+
+    def __init__(
+        self,
+        toolkit: CrawlerToolkit,
+        discovery_mode: CodeforcesDiscoveryMode = CodeforcesDiscoveryMode.per_user,
+        feed_poll_interval: float = 10,
+        sweep_interval: float = 6 * 60 * 60,
+        activity_check_interval: float = 5 * 60,
+    ) -> None:
+        super().__init__(toolkit)
+        self._discovery_mode = discovery_mode
+        self._feed_poll_interval = feed_poll_interval
+        self._sweep_interval = sweep_interval
+        self._activity_check_interval = activity_check_interval
+
+        # Index of handles that were crawled by this instance, mapped to the
+        # (monotonic) time their submission history was last downloaded.
+        self._swept_at: dict[str, float] = {}
+
+        # Handles whose history should be downloaded again on their next crawl:
+        # handles that appeared in the feed since their history was downloaded,
+        # and handles whose last download failed or had unjudged submissions.
+        self._dirty_handles: set[str] = set()
+
+        self._feed_task: asyncio.Task[None] | None = None
+        self._feed_polled_at: float | None = None
+        self._feed_last_id: int | None = None
+        self._feed_judging: dict[int, list[str]] = {}
+
+        # Latest known activity of every handle crawled by this instance. All
+        # handles are checked in batches, once every activity check interval.
+        self._activity: dict[str, UserActivity] = {}
+
+    @classmethod
+    def from_env(cls, toolkit: CrawlerToolkit) -> Self:
+        return cls(
+            toolkit,
+            discovery_mode=CodeforcesDiscoveryMode(
+                os.getenv("CODEFORCES_DISCOVERY_MODE", default="per_user")
+            ),
+            feed_poll_interval=float(
+                os.getenv("CODEFORCES_FEED_POLL_INTERVAL", default="10")
+            ),
+            sweep_interval=float(
+                os.getenv("CODEFORCES_SWEEP_INTERVAL", default=str(6 * 60 * 60))
+            ),
+            activity_check_interval=float(
+                os.getenv("CODEFORCES_ACTIVITY_CHECK_INTERVAL", default=str(5 * 60))
+            ),
+        )
+
     @property
     def submission_model(self) -> type[CodeforcesSubmission]:
         return CodeforcesSubmission
 
+    async def load(self) -> None:
+        if self._toolkit.clients.replay:
+            return  # every stored history is replayed (see _should_download_history)
+
+        if self._discovery_mode == CodeforcesDiscoveryMode.feed:
+            self._feed_task = asyncio.create_task(self._poll_recent_status_forever())
+
+    async def index_integrations(
+        self, integrations: list[CodeforcesIntegration]
+    ) -> None:
+        if self._discovery_mode != CodeforcesDiscoveryMode.activity:
+            return
+
+        # Histories that were downloaded before a restart are not downloaded
+        # again, so their handles are indexed here (instead of in crawl) to be
+        # checked together, in the first batches after the restart.
+        for integration in integrations:
+            if integration.handle and integration.last_history_fetch is not None:
+                self._activity.setdefault(integration.handle, UserActivity(0, 0))
+
+    async def close(self) -> None:
+        if self._feed_task is not None:
+            self._feed_task.cancel()
+            self._feed_task = None
+
     async def crawl(
         self, integration: CodeforcesIntegration
     ) -> AsyncIterable[CodeforcesCrawledSubmission]:
@@ -77,13 +213,36 @@ class CodeforcesCrawler(
             logger.info("No available Codeforces user, skipping.")
             return
 
-        response = await self._get_user_submissions(handle)
+        # Submissions that appear in the feed (or activity that is reported)
+        # from now on are not necessarily included in the downloaded history.
+        self._dirty_handles.discard(handle)
+        history_fetch = current_datetime()
+        try:
+            response = await self._get_user_submissions(handle)
+        except BaseException:
+            self._dirty_handles.add(handle)  # retry on the next crawl
+            raise
+        self._swept_at[handle] = time.monotonic()
+        if self._discovery_mode == CodeforcesDiscoveryMode.activity:
+            integration.last_history_fetch = history_fetch
+            # Index the handle, to be included in the next batch check.
+            self._activity.setdefault(handle, UserActivity(0, 0))
 
-        submissions = response.json().get("result", [])
+        # Full submission histories may be several megabytes of JSON.
+        submissions = await self._toolkit.parser.run(
+            self._parse_user_submissions, response.content
+        )
         for sub in submissions:
+            if sub.get("verdict") in (None, "TESTING"):
+                # The verdict is part of the submission id, so a submission is
+                # yielded only after it is judged. Download the history again
+                # on the next crawl, until it is.
+                self._dirty_handles.add(handle)
+                continue
+
             yield CodeforcesCrawledSubmission(
                 integration=integration,
-                problem=Problem(problem_url=self._get_problem_url(sub["problem"])),
+                problem=problem_catalog.get(self._get_problem_url(sub["problem"])),
                 verdict=(
                     SubmissionVerdict.accepted
                     if sub["verdict"] == "OK"
@@ -106,17 +265,15 @@ class CodeforcesCrawler(
             # publicly available. We get redirected to home page in that case (302).
             return CodeforcesSubmission.from_crawled(crawled_submission)
 
-        soup = BeautifulSoup(response.text, "lxml")
-        code_block = soup.find("pre", id="program-source-text")
-
-        if code_block is None:
+        code = await self._toolkit.parser.run(
+            self._parse_submission_source_code, response.content
+        )
+        if code is None:
             raise CrawlerError(
                 "Can't locate source code of submission "
                 f"{crawled_submission.submission_url}"
             )
 
-        code = html.unescape(code_block.text)
-
         try:
             raw_code_url = await self._toolkit.file_uploader.upload(StringIO(code))
         except FileUploadError:
@@ -126,10 +283,163 @@ class CodeforcesCrawler(
             crawled_submission, raw_code_url=raw_code_url
         )
 
+    async def should_crawl(self, integration: CodeforcesIntegration) -> bool:
+        if integration.handle is None:
+            logger.info("No available Codeforces user, skipping.")
+            return False
+
+        if not await self._should_download_history(integration):
+            logger.debug("No new activity of Codeforces user '%s'", integration.handle)
+            return False
+        return True
+
+    async def _should_download_history(
+        self, integration: CodeforcesIntegration
+    ) -> bool:
+        if self._toolkit.clients.replay:
+            # The feed and the activity checks depend on the state of the
+            # crawler, so their requests can not be replayed.
+            return True
+
+        if integration.handle in self._dirty_handles:
+            return True  # the last download failed, or had unjudged submissions
+
+        match self._discovery_mode:
+            case CodeforcesDiscoveryMode.feed:
+                return self._appeared_in_feed(integration.handle)
+            case CodeforcesDiscoveryMode.activity:
+                return await self._was_active(integration)
+            case _:
+                return True
+
+    def _appeared_in_feed(self, handle: str) -> bool:
+        swept_at = self._swept_at.get(handle)
+        if swept_at is None or handle in self._dirty_handles:
+            return True
+
+        if (
+            self._feed_polled_at is None
+            or time.monotonic() - self._feed_polled_at > 3 * self._feed_poll_interval
+        ):
+            return True  # the feed is not available, fall back to polling users
+
+        return time.monotonic() - swept_at >= self._sweep_interval
+
+    async def _was_active(self, integration: CodeforcesIntegration) -> bool:
+        """Returns True if the user was online since their submission history
+        was last downloaded, or if the history is due for a sweep."""
+        fetched_at = integration.last_history_fetch
+        if (
+            fetched_at is None
+            or (current_datetime() - fetched_at).total_seconds() >= self._sweep_interval
+        ):
+            return True
+
+        handle = integration.handle
+        activity = self._activity.get(handle)
+        if (
+            activity is None
+            or time.time() - activity.checked_at >= self._activity_check_interval
+        ):
+            await self._check_activity(handle)
+            if (activity := self._activity.get(handle)) is None:
+                return True  # not reported by user.info, try to download anyway
+
+        return activity.last_online_at >= fetched_at.timestamp()
+
+    async def _check_activity(self, handle: str) -> None:
+        """Check the activity of the provided handle, together with the known
+        handles whose activity was not checked for the longest time."""
+        now = time.time()
+        stale_handles = sorted(
+            (
+                known_handle
+                for known_handle, activity in self._activity.items()
+                if known_handle != handle
+                and now - activity.checked_at >= self._activity_check_interval
+            ),
+            key=lambda known_handle: self._activity[known_handle].checked_at,
+        )
+        batch = [handle, *stale_handles[: USER_INFO_BATCH_SIZE - 1]]
+
+        while batch:
+            response = await self._get_users_info(batch)
+            if response.status_code == 400:
+                # The request fails if any of the handles does not exist.
+                # Leave it out (its history download will report the error).
+                missing = self._parse_missing_handle(response.content)
+                if missing is None or missing not in batch:
+                    raise CrawlerError(
+                        "Can not check activity of Codeforces users.", response.text
+                    )
+                batch.remove(missing)
+                self._activity.pop(missing, None)
+                continue
+
+            response.raise_for_status()
+            last_online = await self._toolkit.parser.run(
+                self._parse_users_last_online, response.content
+            )
+            # Users are returned in the order of the requested handles.
+            for checked_handle, last_online_at in zip(batch, last_online):
+                self._activity[checked_handle] = UserActivity(last_online_at, now)
+            logger.info("Checked activity of %d Codeforces users", len(batch))
+            return
+
+    async def _poll_recent_status_forever(self) -> None:
+        while True:
+            try:
+                await self._poll_recent_status()
+            except Exception:
+                logger.warning("Failed to poll Codeforces recent status", exc_info=True)
+            await asyncio.sleep(self._feed_poll_interval)
+
+    async def _poll_recent_status(self) -> None:
+        response = await self._get_recent_status()
+        submissions = await self._toolkit.parser.run(
+            self._parse_recent_status, response.content
+        )
+
+        last_id = self._feed_last_id
+        if submissions and (last_id is None or submissions[-1].id > last_id):
+            # The feed does not reach back to the previous poll, so submissions
+            # might have been missed. Download the history of all users.
+            logger.info("Codeforces recent status feed has a gap")
+            self._dirty_handles.update(self._swept_at)
+
+        judging: dict[int, list[str]] = {}
+        for submission in submissions:
+            if (
+                last_id is None
+                or submission.id > last_id
+                or submission.id in self._feed_judging
+            ):
+                # New submission, or a submission that was still being judged
+                # (its verdict may have changed since it was downloaded).
+                self._mark_dirty(submission.handles)
+            if not submission.judged:
+                judging[submission.id] = submission.handles
+
+        # Submissions that left the feed before their judging has completed.
+        seen_ids = {submission.id for submission in submissions}
+        for submission_id, handles in self._feed_judging.items():
+            if submission_id not in seen_ids:
+                self._mark_dirty(handles)
+
+        self._feed_judging = judging
+        if submissions:
+            self._feed_last_id = max(last_id or 0, submissions[0].id)
+        self._feed_polled_at = time.monotonic()
+
+    def _mark_dirty(self, handles: list[str]) -> None:
+        for handle in handles:
+            if handle in self._swept_at:  # only handles of crawled integrations
+                self._dirty_handles.add(handle)
+
     @codeforces_html_limits
     @backoff_on_exception
     async def _get_submission_page(self, submission_url: HttpUrl) -> Response:
-        response = await self._toolkit.client.get(
+        response = await self._client.get(
             str(submission_url),
             follow_redirects=False,
         )
@@ -142,9 +452,7 @@ class CodeforcesCrawler(
     @backoff_on_exception
     async def _get_user_submissions(self, handle: str) -> Response:
         url = "https://codeforces.com/api/user.status"
-        response = await self._toolkit.client.get(
-            url, params={"handle": handle, "from": 1}
-        )
+        response = await self._client.get(url, params={"handle": handle, "from": 1})
         if response.status_code == 400:
             raise CrawlerError(
                 f"Can not crawl Codeforces user '{handle}'.",
@@ -154,6 +462,66 @@ class CodeforcesCrawler(
         response.raise_for_status()
         return response
 
+    @codeforces_api_limits
+    @backoff_on_exception
+    async def _get_recent_status(self) -> Response:
+        url = "https://codeforces.com/api/problemset.recentStatus"
+        response = await self._client.get(url, params={"count": RECENT_STATUS_COUNT})
+        response.raise_for_status()
+        return response
+
+    @codeforces_api_limits
+    @backoff_on_exception
+    async def _get_users_info(self, handles: list[str]) -> Response:
+        url = "https://codeforces.com/api/user.info"
+        response = await self._client.get(url, params={"handles": ";".join(handles)})
+        if response.status_code != 400:
+            response.raise_for_status()
+        return response
+
+    # The _parse_* methods below are run by the parsing executor (possibly in
+    # another process). They accept raw page content and return plain data.
+
+    @classmethod
+    def _parse_user_submissions(cls, content: bytes) -> list[dict[str, Any]]:
+        return json.loads(content).get("result", [])
+
+    @classmethod
+    def _parse_recent_status(cls, content: bytes) -> list[RecentSubmission]:
+        """Returns the submissions in the feed, newest first."""
+        submissions = [
+            RecentSubmission(
+                id=sub["id"],
+                handles=[
+                    member["handle"].lower() for member in sub["author"]["members"]
+                ],
+                judged=sub.get("verdict") not in (None, "TESTING"),
+            )
+            for sub in json.loads(content).get("result", [])
+        ]
+        submissions.sort(key=lambda submission: submission.id, reverse=True)
+        return submissions
+
+    @classmethod
+    def _parse_users_last_online(cls, content: bytes) -> list[float]:
+        return [user["lastOnlineTimeSeconds"] for user in json.loads(content)["result"]]
+
+    @classmethod
+    def _parse_missing_handle(cls, content: bytes) -> str | None:
+        # For example: "handles: User with handle tourist1 not found"
+        comment: str = json.loads(content).get("comment", "")
+        _, _, rest = comment.partition("User with handle ")
+        handle, _, suffix = rest.partition(" not found")
+        return handle.lower() if handle and suffix == "" else None
+
+    @classmethod
+    def _parse_submission_source_code(cls, page: bytes) -> str | None:
+        soup = BeautifulSoup(page, "lxml")
+        code_block = soup.find("pre", id="program-source-text")
+        if code_block is None:
+            return None
+        return html.unescape(code_block.text)
+
     @classmethod
     def _get_contest_id(cls, problem: dict[str, Any]) -> int:
         return int(problem["contestId"])
@@ -168,12 +536,13 @@ class CodeforcesCrawler(
         return problem["index"]
 
     @classmethod
-    def _get_problem_url(cls, problem: dict[str, Any]) -> HttpUrl:
+    def _get_problem_url(cls, problem: dict[str, Any]) -> str:
         contest_id = cls._get_contest_id(problem)
         problem_id = cls._get_problem_id(problem)
         contest_type = cls._get_contest_type(problem)
-        url = f"https://codeforces.com/{contest_type}/{contest_id}/problem/{problem_id}"
-        return HttpUrl(url)
+        return (
+            f"https://codeforces.com/{contest_type}/{contest_id}/problem/{problem_id}"
+        )
 
     @classmethod
     def _get_submission_id(cls, submission: dict[str, Any]) -> str:
@@ -1,31 +1,44 @@
+import asyncio
 import html
+import json
+import os
+import time
 from collections.abc import AsyncIterable
 from datetime import datetime, timezone
+from functools import cached_property
 from io import StringIO
 from logging import getLogger
-from typing import NamedTuple
+from pathlib import Path
+from typing import NamedTuple, Self
 
 import backoff
 import bs4
 from bs4 import BeautifulSoup
 from httpx import HTTPError, Response
-from limited import AsyncLimiter
 from pydantic import AwareDatetime, HttpUrl, computed_field
 
 from cccrawl.crawlers.base import Crawler
 from cccrawl.crawlers.error import CrawlerError
 from cccrawl.crawlers.toolkit import CrawlerToolkit
+from cccrawl.crawlers.toolkit.http import HttpClientSettings
+from cccrawl.crawlers.toolkit.limits import SharedLimiter
 from cccrawl.files.base import FileUploadError
 from cccrawl.integrations.cses import CsesIntegration
 from cccrawl.models.base import ModelId
-from cccrawl.models.problem import Problem
+from cccrawl.models.integration import Platform
+from cccrawl.models.problem import Problem, problem_catalog
 from cccrawl.models.submission import CrawledSubmission, Submission, SubmissionVerdict
+from cccrawl.utils.logs import fields
 
 logger = getLogger(__name__)
 
-cses_limiter = AsyncLimiter(limit=3, every=5)
+cses_limiter = SharedLimiter("cses", limit=3, every=5)
 backoff_on_exception = backoff.on_exception(backoff.expo, HTTPError, max_time=120)
 
+# After a failed login, the crawler does not log in again for this long
+# (seconds). Hacking lists are fetched logged out in the meantime.
+LOGIN_RETRY_INTERVAL = 15 * 60
+
 
 class CsesCredentials(NamedTuple):
     """Representing credentials of a CSES user, that is used by the crawler
@@ -43,6 +56,29 @@ class HackableSubmissionDescriptor(NamedTuple):
     submission_url: HttpUrl
 
 
+class ProfileProblemLink(NamedTuple):
+    """A link to a submitted problem, parsed from the profile page of a CSES
+    user."""
+
+    problem_path: str
+    accepted: bool
+
+
+class HackingListPage(NamedTuple):
+    """Data parsed from the hacking list page of a CSES problem. 'submissions'
+    is None if the list is not available (see _get_hackable_submissions)."""
+
+    logged_in: bool
+    submissions: list[tuple[str, str]] | None  # (username, submission path)
+
+
+class HackingSubmissionPage(NamedTuple):
+    """Data parsed from the hacking page of a single CSES submission."""
+
+    submitted_at: datetime
+    code: str
+
+
 class CsesCrawledSubmission(CrawledSubmission[CsesIntegration]):
     """A dataclass containing crawled information about submissions from
     https://cses.fi.
@@ -53,7 +89,7 @@ class CsesCrawledSubmission(CrawledSubmission[CsesIntegration]):
     per problem (one accepted and one rejected)."""
 
     @computed_field  # type: ignore[misc]
-    @property
+    @cached_property
     def id(self) -> ModelId:
         return ModelId(
             self._hash_tokens(
@@ -69,10 +105,20 @@ class CsesSubmission(Submission[CsesIntegration], CsesCrawledSubmission):
 
 
 class CsesCrawler(Crawler[CsesIntegration, CsesCrawledSubmission, CsesSubmission]):
+    platform = Platform.cses
+
+    # Sized to cses_limiter: at most 3 requests every 5 seconds.
+    http_client_settings = HttpClientSettings(
+        max_connections=3,
+        max_keepalive_connections=3,
+        keepalive_expiry=15,
+    )
+
     def __init__(
         self,
         toolkit: CrawlerToolkit,
         credentials: CsesCredentials | None = None,
+        session_path: str | os.PathLike[str] | None = None,
     ) -> None:
         super().__init__(toolkit)
 
@@ -82,14 +128,49 @@ class CsesCrawler(Crawler[CsesIntegration, CsesCrawledSubmission, CsesSubmission
                 "Credentials not provided for CSES crawler, functionality limited"
             )
 
+        # Session cookies are persisted to this file (if provided), so that a
+        # restarted crawler can reuse the session instead of logging in again.
+        self._session_path = Path(session_path) if session_path else None
+
+        # Incremented on every login. Used to make sure that when several tasks
+        # detect an expired session at once, only a single login is performed.
+        self._session_generation = 0
+        self._login_lock = asyncio.Lock()
+        self._login_failed_at: float | None = None  # monotonic time
+
+    @classmethod
+    def from_env(cls, toolkit: CrawlerToolkit) -> Self:
+        username = os.getenv("CSES_USERNAME")
+        password = os.getenv("CSES_PASSWORD")
+        credentials = None
+        if username and password:
+            credentials = CsesCredentials(username=username, password=password)
+        return cls(
+            toolkit,
+            credentials=credentials,
+            session_path=os.getenv("CSES_SESSION_PATH"),
+        )
+
     async def load(self) -> None:
-        if self._credentials:
+        if not self._credentials or self._toolkit.clients.replay:
+            # Archived responses are replayed as they were, logged in or not.
+            return
+
+        async with self._login_lock:
+            if self._restore_session() and await self._is_session_valid():
+                logger.info("Restored persisted CSES session")
+                return
             await self._preform_session_login(self._credentials)
 
     @property
     def submission_model(self) -> type[CsesSubmission]:
         return CsesSubmission
 
+    async def close(self) -> None:
+        # The session cookie may have been refreshed since the last login.
+        if self._credentials:
+            self._save_session()
+
     async def crawl(
         self, integration: CsesIntegration
     ) -> AsyncIterable[CsesCrawledSubmission]:
@@ -100,19 +181,18 @@ class CsesCrawler(Crawler[CsesIntegration, CsesCrawledSubmission, CsesSubmission
         response = await self._get_user_profile(user_number)
         response.raise_for_status()
 
-        soup = BeautifulSoup(response.text, "lxml")
-        table = soup.find("table")
-        if table is None:
+        links = await self._toolkit.parser.run(
+            self._parse_profile_page, response.content
+        )
+        if links is None:
             raise CrawlerError(f"CSES user {user_number} does not exist")
 
-        submitted_tags = table.find_all("a", {"class": {"full", "zero"}})
-
-        for a_tag in submitted_tags:
+        for link in links:
             yield CsesCrawledSubmission(
                 integration=integration,
-                problem=Problem(problem_url="https://cses.fi" + a_tag["href"][:-1]),
+                problem=problem_catalog.get("https://cses.fi" + link.problem_path),
                 verdict=SubmissionVerdict.accepted
-                if "full" in a_tag["class"]
+                if link.accepted
                 else SubmissionVerdict.rejected,
             )
 
@@ -142,7 +222,8 @@ class CsesCrawler(Crawler[CsesIntegration, CsesCrawledSubmission, CsesSubmission
         # If for some reason the submission wasn't found in the recent
         # submissions list, build submission from existing data only.
         logger.info(
-            f"CSES Submission {crawled_submission.id} not found in hacking list."
+            "CSES submission not found in hacking list",
+            extra=fields(id=crawled_submission.id),
         )
         return CsesSubmission.from_crawled(crawled_submission)
 
@@ -152,29 +233,28 @@ class CsesCrawler(Crawler[CsesIntegration, CsesCrawledSubmission, CsesSubmission
         if not self._credentials:
             return  # credentials are required
 
-        response = await self._get_list_of_hackable_submissions_page(problem)
-        content = self._get_cses_page_content(response)
+        session_generation = await self._wait_for_session()
+        page = await self._get_hacking_list(problem)
 
-        table = content.find("table")
-        if not isinstance(table, bs4.Tag):
+        renewed = False
+        if page.submissions is None and not page.logged_in:
+            # Session expired. Log in again and retry (once).
+            renewed = await self._renew_session(session_generation)
+            if renewed:
+                page = await self._get_hacking_list(problem)
+
+        if page.submissions is None:
             # Table not found if user not logged in (invalid credentials),
             # or the user did not solve the problem. In both cases we 'fail'
             # quietly, as if there are no submissions to the problem
-            if not self._check_if_logged_in(response):
+            if renewed and not page.logged_in:
                 logger.warning(
                     "CSES Credentials provided, but crawling session is logged out. "
                     "Credentials may be invalid OR sessions expired for some reason."
                 )
             return
 
-        for row in table.find_all("tr"):
-            cols = row.find_all("td")
-            if not cols:
-                continue  # skip over header row(s)
-
-            submission_user = cols[1].text.strip()
-            submission_path = cols[-1].find("a", href=True)["href"]
-
+        for submission_user, submission_path in page.submissions:
             yield HackableSubmissionDescriptor(
                 submission_username=submission_user,
                 submission_url=HttpUrl.build(
@@ -190,21 +270,25 @@ class CsesCrawler(Crawler[CsesIntegration, CsesCrawledSubmission, CsesSubmission
         hackable_submission: HackableSubmissionDescriptor,
     ) -> CsesSubmission:
         response = await self._get_hackable_submission_page(hackable_submission)
-        content = self._get_cses_page_content(response)
-        table = content.find("table")
-        if not isinstance(table, bs4.Tag):
-            raise CrawlerError("Hacking metadata table not found")
+        page = await self._toolkit.parser.run(
+            self._parse_hacking_submission_page, response.content
+        )
 
         return CsesSubmission.from_crawled(
             crawled_submission,
             submission_url=hackable_submission.submission_url,
-            submitted_at=self._get_submission_time_from_hacking_metadata_table(table),
-            raw_code_url=await self._upload_source_code_from_hacking_content(content),
+            submitted_at=page.submitted_at,
+            raw_code_url=await self._upload_source_code(page.code),
+        )
+
+    async def _get_hacking_list(self, problem: Problem) -> HackingListPage:
+        response = await self._get_list_of_hackable_submissions_page(problem)
+        return await self._toolkit.parser.run(
+            self._parse_hacking_list_page, response.content
         )
 
     @staticmethod
-    def _check_if_logged_in(response: Response) -> bool:
-        soup = BeautifulSoup(response.text)
+    def _check_if_logged_in(soup: BeautifulSoup) -> bool:
         return soup.find("a", {"href": "/logout"}) is not None
 
     async def _preform_session_login(self, credentials: CsesCredentials) -> None:
@@ -212,12 +296,88 @@ class CsesCrawler(Crawler[CsesIntegration, CsesCrawledSubmission, CsesSubmission
         await self._post_login_form(csrf_token, credentials)
 
         # PHP session now should be stored under the PHPSESSID cookie.
-        assert "PHPSESSID" in self._toolkit.client.cookies
+        if "PHPSESSID" not in self._client.cookies:
+            raise CrawlerError("CSES login did not set a session cookie")
+        self._session_generation += 1
+        self._save_session()
+
+    async def _wait_for_session(self) -> int:
+        """Wait for a login that is in progress (if any), and return the
+        generation of the current session."""
+        async with self._login_lock:
+            return self._session_generation
+
+    async def _renew_session(self, expired_generation: int) -> bool:
+        """Log in again, unless the expired session was already renewed by a
+        concurrent task. Other tasks wait for the login to complete. Returns
+        False if the session was not renewed, since a login failed recently."""
+        assert self._credentials is not None
+        async with self._login_lock:
+            if self._session_generation != expired_generation:
+                return True  # already renewed by another task
+
+            failed_at = self._login_failed_at
+            if (
+                failed_at is not None
+                and time.monotonic() - failed_at < LOGIN_RETRY_INTERVAL
+            ):
+                return False
+
+            logger.info("CSES session expired, logging in again")
+            try:
+                await self._preform_session_login(self._credentials)
+            except (CrawlerError, HTTPError):
+                # Don't let every waiting task (or every following submission)
+                # retry a failing login, and don't fail the crawl: pages are
+                # crawled as logged out until the retry interval passes.
+                self._login_failed_at = time.monotonic()
+                logger.error("Failed to renew CSES session", exc_info=True)
+                return False
+
+            self._login_failed_at = None
+            return True
+
+    def _restore_session(self) -> bool:
+        if self._session_path is None:
+            return False
+
+        try:
+            cookies = json.loads(self._session_path.read_text(encoding="utf8"))
+        except (OSError, ValueError):
+            return False
+
+        for cookie in cookies:
+            self._client.cookies.set(**cookie)
+        return True
+
+    def _save_session(self) -> None:
+        if self._session_path is None:
+            return
+
+        cookies = [
+            {
+                "name": cookie.name,
+                "value": cookie.value,
+                "domain": cookie.domain,
+                "path": cookie.path,
+            }
+            for cookie in self._client.cookies.jar
+            if cookie.domain.endswith("cses.fi")
+        ]
+        try:
+            self._session_path.write_text(json.dumps(cookies), encoding="utf8")
+        except OSError:
+            logger.warning("Failed to persist CSES session", exc_info=True)
+
+    async def _is_session_valid(self) -> bool:
+        response = await self._get_home_page()
+        soup = BeautifulSoup(response.content, "lxml")
+        return self._check_if_logged_in(soup)
 
     @cses_limiter
     @backoff_on_exception
     async def _get_login_csrf_token(self) -> str:
-        response = await self._toolkit.client.get("https://cses.fi/login")
+        response = await self._client.get("https://cses.fi/login")
         response.raise_for_status()
 
         csrf_input = BeautifulSoup(response.text, "lxml").find(
@@ -238,7 +398,7 @@ class CsesCrawler(Crawler[CsesIntegration, CsesCrawledSubmission, CsesSubmission
     async def _post_login_form(
         self, csrf_token: str, credentials: CsesCredentials
     ) -> None:
-        response = await self._toolkit.client.post(
+        response = await self._client.post(
             "https://cses.fi/login",
             data={
                 "csrf_token": csrf_token,
@@ -254,11 +414,18 @@ class CsesCrawler(Crawler[CsesIntegration, CsesCrawledSubmission, CsesSubmission
                 response.text,
             )
 
+    @cses_limiter
+    @backoff_on_exception
+    async def _get_home_page(self) -> Response:
+        response = await self._client.get("https://cses.fi/")
+        response.raise_for_status()
+        return response
+
     @cses_limiter
     @backoff_on_exception
     async def _get_user_profile(self, user_number: int) -> Response:
         url = f"https://cses.fi/problemset/user/{user_number}/"
-        return await self._toolkit.client.get(url)
+        return await self._client.get(url)
 
     @cses_limiter
     @backoff_on_exception
@@ -269,7 +436,7 @@ class CsesCrawler(Crawler[CsesIntegration, CsesCrawledSubmission, CsesSubmission
         _, task_id = problem_url_path.rsplit("/", 1)
         hacking_list_url = f"https://cses.fi/problemset/hack/{task_id}/list/"
 
-        response = await self._toolkit.client.get(hacking_list_url)
+        response = await self._client.get(hacking_list_url)
         response.raise_for_status()
         return response
 
@@ -279,13 +446,69 @@ class CsesCrawler(Crawler[CsesIntegration, CsesCrawledSubmission, CsesSubmission
         self, submission: HackableSubmissionDescriptor
     ) -> Response:
         hacking_url = str(submission.submission_url)
-        response = await self._toolkit.client.get(hacking_url)
+        response = await self._client.get(hacking_url)
         response.raise_for_status()
         return response
 
+    # The _parse_* methods below are run by the parsing executor (possibly in
+    # another process). They accept raw page content and return plain data.
+
+    @classmethod
+    def _parse_profile_page(cls, page: bytes) -> list[ProfileProblemLink] | None:
+        soup = BeautifulSoup(page, "lxml")
+        table = soup.find("table")
+        if not isinstance(table, bs4.Tag):
+            return None
+
+        return [
+            ProfileProblemLink(
+                problem_path=str(a_tag["href"])[:-1],
+                accepted="full" in a_tag["class"],
+            )
+            for a_tag in table.find_all("a", {"class": {"full", "zero"}})
+        ]
+
     @classmethod
-    def _get_cses_page_content(cls, response: Response) -> bs4.Tag:
-        soup = BeautifulSoup(response.text, "lxml")
+    def _parse_hacking_list_page(cls, page: bytes) -> HackingListPage:
+        soup = BeautifulSoup(page, "lxml")
+        logged_in = cls._check_if_logged_in(soup)
+        table = cls._get_cses_page_content(soup).find("table")
+        if not isinstance(table, bs4.Tag):
+            return HackingListPage(logged_in=logged_in, submissions=None)
+
+        submissions = []
+        for row in table.find_all("tr"):
+            cols = row.find_all("td")
+            if not cols:
+                continue  # skip over header row(s)
+
+            link = cols[-1].find("a", href=True)
+            if not isinstance(link, bs4.Tag):
+                continue  # not a submission row
+
+            submission_user = cols[1].text.strip()
+            submissions.append((submission_user, str(link["href"])))
+
+        return HackingListPage(logged_in=logged_in, submissions=submissions)
+
+    @classmethod
+    def _parse_hacking_submission_page(cls, page: bytes) -> HackingSubmissionPage:
+        content = cls._get_cses_page_content(BeautifulSoup(page, "lxml"))
+        table = content.find("table")
+        if not isinstance(table, bs4.Tag):
+            raise CrawlerError("Hacking metadata table not found")
+
+        code_block = content.find("pre", {"class": "prettyprint"})
+        if not isinstance(code_block, bs4.Tag):
+            raise CrawlerError("Submission source code block not found on hacking page")
+
+        return HackingSubmissionPage(
+            submitted_at=cls._get_submission_time_from_hacking_metadata_table(table),
+            code=html.unescape(code_block.text),
+        )
+
+    @classmethod
+    def _get_cses_page_content(cls, soup: BeautifulSoup) -> bs4.Tag:
         content = soup.find("div", {"class": "content"})
         if not isinstance(content, bs4.Tag):
             raise CrawlerError("Can't find content tag of hacking page")
@@ -304,14 +527,7 @@ class CsesCrawler(Crawler[CsesIntegration, CsesCrawledSubmission, CsesSubmission
         # we want to convert it to UTC.
         return submitted_at.astimezone(timezone.utc)
 
-    async def _upload_source_code_from_hacking_content(
-        self, content: bs4.Tag
-    ) -> HttpUrl | None:
-        code_block = content.find("pre", {"class": "prettyprint"})
-        if not isinstance(code_block, bs4.Tag):
-            raise CrawlerError("Submission source code block not found on hacking page")
-
-        code = html.unescape(code_block.text)
+    async def _upload_source_code(self, code: str) -> HttpUrl | None:
         try:
             return await self._toolkit.file_uploader.upload(StringIO(code))
         except FileUploadError:
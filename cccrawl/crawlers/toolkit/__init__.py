@@ -1,10 +1,11 @@
 from typing import NamedTuple
 
-from httpx import AsyncClient
-
+from cccrawl.crawlers.toolkit.http import HttpClientPool
+from cccrawl.crawlers.toolkit.parsing import ParsingExecutor
 from cccrawl.files.base import FileUploadService
 
 
 class CrawlerToolkit(NamedTuple):
-    client: AsyncClient
+    clients: HttpClientPool
     file_uploader: FileUploadService
+    parser: ParsingExecutor
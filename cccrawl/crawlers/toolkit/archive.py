@@ -0,0 +1,192 @@
+import asyncio
+import base64
+import gzip
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any
+
+from httpx import AsyncBaseTransport, Request, Response
+
+from cccrawl.crawlers.error import CrawlerError
+
+# Response headers that describe the encoding of the raw body on the wire.
+# The archive stores decoded bodies, so these headers are not archived.
+_ENCODING_HEADERS = frozenset(
+    {"content-encoding", "content-length", "transfer-encoding"}
+)
+
+# Response headers that may carry credentials (such as session tokens), which
+# should never be written to disk.
+_CREDENTIAL_HEADERS = frozenset(
+    {"set-cookie", "set-cookie2", "authorization", "proxy-authorization"}
+)
+
+# Size (in bytes) after which a new chunk file is started.
+CHUNK_SIZE_LIMIT = 256 * 1024 * 1024
+
+INDEX_SCHEMA = """
+CREATE TABLE IF NOT EXISTS records (
+    key TEXT NOT NULL,
+    url TEXT NOT NULL,
+    fetched_at REAL NOT NULL,
+    chunk TEXT NOT NULL,
+    offset INTEGER NOT NULL,
+    length INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS records_by_key ON records (key, fetched_at);
+CREATE INDEX IF NOT EXISTS records_by_url ON records (url, fetched_at);
+"""
+
+
+class ArchiveMissError(CrawlerError):
+    """Raised while replaying from the archive, when the requested resource
+    was never archived."""
+
+
+class ResponseArchive:
+    """An append-only, compressed archive of raw HTTP responses.
+
+    Responses are appended to chunk files, each record compressed as a separate
+    gzip member, so a single record can be read back without decompressing
+    the whole chunk. Records are indexed (by request and URL, and by fetch
+    time) in an sqlite index that is stored alongside the chunks. Several
+    processes may append to the same archive, each to its own chunk files."""
+
+    def __init__(self, directory: str | os.PathLike[str]) -> None:
+        self._directory = Path(directory)
+        self._directory.mkdir(parents=True, exist_ok=True)
+        self._index = sqlite3.connect(
+            self._directory / "index.sqlite3",
+            timeout=30,
+            check_same_thread=False,
+        )
+        self._index.executescript(INDEX_SCHEMA)
+        self._lock = threading.Lock()
+        self._chunk: Path | None = None
+
+    def close(self) -> None:
+        self._index.close()
+
+    async def append(self, request: Request, response: Response) -> None:
+        await asyncio.to_thread(self._append, request, response)
+
+    async def lookup(
+        self, request: Request, as_of: float | None = None
+    ) -> Response | None:
+        """Returns the latest archived response to the provided request, that
+        was fetched before the provided time (unix timestamp), if any."""
+        return await asyncio.to_thread(self._lookup, request, as_of)
+
+    @staticmethod
+    def _get_request_key(request: Request) -> str:
+        hash = hashlib.sha256()
+        for token in (
+            request.method.encode(),
+            str(request.url).encode(),
+            request.content,
+        ):
+            hash.update(token)
+            hash.update(b"\0")
+        return hash.hexdigest()
+
+    def _append(self, request: Request, response: Response) -> None:
+        record = {
+            "method": request.method,
+            "url": str(request.url),
+            "fetched_at": time.time(),
+            "status_code": response.status_code,
+            "headers": [
+                (name, value)
+                for name, value in response.headers.multi_items()
+                if name.lower() not in _ENCODING_HEADERS
+                and name.lower() not in _CREDENTIAL_HEADERS
+            ],
+            "content": base64.b64encode(response.content).decode("ascii"),
+        }
+        data = gzip.compress(json.dumps(record).encode("utf8"))
+
+        with self._lock:
+            chunk = self._get_writable_chunk()
+            with chunk.open("ab") as file:
+                offset = file.tell()
+                file.write(data)
+
+            with self._index:
+                self._index.execute(
+                    "INSERT INTO records VALUES (?, ?, ?, ?, ?, ?)",
+                    (
+                        self._get_request_key(request),
+                        record["url"],
+                        record["fetched_at"],
+                        chunk.name,
+                        offset,
+                        len(data),
+                    ),
+                )
+
+    def _lookup(self, request: Request, as_of: float | None) -> Response | None:
+        with self._lock:
+            row = self._index.execute(
+                "SELECT chunk, offset, length FROM records "
+                "WHERE key = ? AND fetched_at <= ? "
+                "ORDER BY fetched_at DESC LIMIT 1",
+                (self._get_request_key(request), as_of or float("inf")),
+            ).fetchone()
+
+        if row is None:
+            return None
+
+        chunk, offset, length = row
+        with (self._directory / chunk).open("rb") as file:
+            file.seek(offset)
+            record: dict[str, Any] = json.loads(gzip.decompress(file.read(length)))
+
+        return Response(
+            status_code=record["status_code"],
+            headers=record["headers"],
+            content=base64.b64decode(record["content"]),
+            request=request,
+        )
+
+    def _get_writable_chunk(self) -> Path:
+        if self._chunk is None or self._chunk.stat().st_size >= CHUNK_SIZE_LIMIT:
+            name = f"chunk-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}.gz"
+            self._chunk = self._directory / name
+        return self._chunk
+
+
+class RecordingTransport(AsyncBaseTransport):
+    """Forwards requests to the wrapped transport, and archives all
+    responses."""
+
+    def __init__(self, transport: AsyncBaseTransport, archive: ResponseArchive):
+        self._transport = transport
+        self._archive = archive
+
+    async def handle_async_request(self, request: Request) -> Response:
+        response = await self._transport.handle_async_request(request)
+        await response.aread()
+        await self._archive.append(request, response)
+        return response
+
+    async def aclose(self) -> None:
+        await self._transport.aclose()
+
+
+class ReplayTransport(AsyncBaseTransport):
+    """Serves requests from the archive only, without any network access."""
+
+    def __init__(self, archive: ResponseArchive, as_of: float | None = None):
+        self._archive = archive
+        self._as_of = as_of
+
+    async def handle_async_request(self, request: Request) -> Response:
+        response = await self._archive.lookup(request, as_of=self._as_of)
+        if response is None:
+            raise ArchiveMissError(f"{request.method} {request.url} is not archived")
+        return response
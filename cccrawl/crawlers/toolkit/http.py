@@ -0,0 +1,113 @@
+from collections.abc import Mapping
+from importlib.util import find_spec
+from logging import getLogger
+from types import TracebackType
+from typing import NamedTuple, Self
+
+from httpx import AsyncBaseTransport, AsyncClient, AsyncHTTPTransport, Limits, Timeout
+
+from cccrawl.crawlers.toolkit.archive import (
+    RecordingTransport,
+    ReplayTransport,
+    ResponseArchive,
+)
+from cccrawl.models.integration import Platform
+
+logger = getLogger(__name__)
+
+
+class HttpClientSettings(NamedTuple):
+    """Connection settings of the HTTP client that is used for a single
+    platform. Pools should be sized according to the rate limits of the
+    platform: there is no use in holding more connections than the number of
+    requests that the limiter allows at once."""
+
+    max_connections: int = 10
+    max_keepalive_connections: int = 5
+    keepalive_expiry: float = 30  # seconds
+    timeout: float = 30  # seconds
+    connect_timeout: float = 10  # seconds
+    http2: bool = True  # used only if the optional 'h2' package is installed
+
+
+class HttpClientPool:
+    """Provides a dedicated HTTP client for every platform, each with its own
+    connection pool and cookie jar, so that requests to one platform never wait
+    for connections (or share cookies) of another. Requests that are not
+    related to a specific platform share an additional default client.
+
+    If an archive is provided, all responses are recorded into it. In replay
+    mode, responses are served from the archive only, without network access."""
+
+    def __init__(
+        self,
+        settings: Mapping[Platform, HttpClientSettings],
+        archive: ResponseArchive | None = None,
+        replay: bool = False,
+    ) -> None:
+        if replay and archive is None:
+            raise ValueError("An archive is required for replay mode")
+
+        self._settings = settings
+        self._archive = archive
+        self._replay = replay
+        self._clients: dict[Platform | None, AsyncClient] = {}
+        self._http2_available = find_spec("h2") is not None
+
+    async def __aenter__(self) -> Self:
+        return self
+
+    async def __aexit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        for client in self._clients.values():
+            await client.aclose()
+        self._clients.clear()
+
+    @property
+    def replay(self) -> bool:
+        """True if responses are served from the archive (see ReplayTransport)."""
+        return self._replay
+
+    def get(self, platform: Platform | None = None) -> AsyncClient:
+        """Returns the client of the provided platform, or the default client
+        if no platform is provided."""
+        if platform not in self._clients:
+            self._clients[platform] = self._create_client(platform)
+        return self._clients[platform]
+
+    def _create_client(self, platform: Platform | None) -> AsyncClient:
+        settings = HttpClientSettings()
+        if platform is not None:
+            settings = self._settings.get(platform, settings)
+
+        return AsyncClient(
+            transport=self._create_transport(platform, settings),
+            timeout=Timeout(settings.timeout, connect=settings.connect_timeout),
+        )
+
+    def _create_transport(
+        self, platform: Platform | None, settings: HttpClientSettings
+    ) -> AsyncBaseTransport:
+        if self._replay:
+            assert self._archive is not None
+            return ReplayTransport(self._archive)
+
+        http2 = settings.http2 and self._http2_available
+        if settings.http2 and not http2:
+            logger.info("'h2' is not installed, using HTTP/1.1 for %s", platform)
+
+        transport: AsyncBaseTransport = AsyncHTTPTransport(
+            http2=http2,
+            limits=Limits(
+                max_connections=settings.max_connections,
+                max_keepalive_connections=settings.max_keepalive_connections,
+                keepalive_expiry=settings.keepalive_expiry,
+            ),
+        )
+        if self._archive is not None:
+            transport = RecordingTransport(transport, self._archive)
+        return transport
@@ -0,0 +1,201 @@
+import asyncio
+import fcntl
+import json
+import os
+import time
+from abc import ABC, abstractmethod
+from collections.abc import Awaitable, Callable
+from functools import wraps
+from logging import getLogger
+from typing import ParamSpec, TypeVar
+
+from limited import AsyncLimiter
+
+from cccrawl.crawlers.error import CrawlerError
+from cccrawl.db.base import Database
+from cccrawl.models.rate_limit import TokenBucket
+
+ParamsT = ParamSpec("ParamsT")
+ReturnT = TypeVar("ReturnT")
+
+logger = getLogger(__name__)
+
+
+class RateLimitWaitCancelledError(CrawlerError):
+    """Raised by a limited request that was still waiting for its turn, when
+    all waits were cancelled (see cancel_rate_limit_waits)."""
+
+
+class RateLimitBackend(ABC):
+    """A store of token buckets that is shared between crawler instances, so
+    that all instances together respect the rate limits of the judges."""
+
+    @abstractmethod
+    async def take(self, key: str, limit: int, every: float) -> float:
+        """Try to consume a single token from the bucket identified by the
+        provided key. Returns zero if a token was consumed, and otherwise the
+        number of seconds to wait before trying again."""
+
+
+class DatabaseRateLimitBackend(RateLimitBackend):
+    """Token buckets stored in the crawler database. Suitable for instances
+    that run on different hosts but share the same egress IP."""
+
+    def __init__(self, db: Database) -> None:
+        self._db = db
+
+    async def take(self, key: str, limit: int, every: float) -> float:
+        return await self._db.take_rate_limit_token(key, limit, every)
+
+
+class FileRateLimitBackend(RateLimitBackend):
+    """Token buckets stored in a local file, guarded by an exclusive file lock.
+    Suitable for instances that run on the same host."""
+
+    def __init__(self, path: str | os.PathLike[str]) -> None:
+        self._path = path
+
+    async def take(self, key: str, limit: int, every: float) -> float:
+        return await asyncio.to_thread(self._take, key, limit, every)
+
+    def _take(self, key: str, limit: int, every: float) -> float:
+        with open(self._path, "a+", encoding="utf8") as file:
+            fcntl.flock(file, fcntl.LOCK_EX)  # released when the file is closed
+            file.seek(0)
+            buckets = json.loads(file.read() or "{}")
+
+            now = time.time()
+            if key in buckets:
+                bucket = TokenBucket.model_validate(buckets[key])
+            else:
+                bucket = TokenBucket.full(key, limit, now)
+            wait = bucket.take(limit, every, now)
+
+            buckets[key] = bucket.model_dump(mode="json")
+            file.seek(0)
+            file.truncate()
+            file.write(json.dumps(buckets))
+            return wait
+
+
+_backend: RateLimitBackend | None = None
+_enabled = True
+_waits_cancelled = False
+
+# Tasks of limited requests that are waiting for their turn.
+_waiting: set[asyncio.Task] = set()
+
+
+def set_rate_limit_backend(backend: RateLimitBackend | None) -> None:
+    """Set the backend that is used by all shared limiters. If no backend is
+    set, every process limits its own requests independently."""
+    global _backend
+    _backend = backend
+
+
+def set_rate_limits_enabled(enabled: bool) -> None:
+    """Enable or disable all shared limiters. Limits should only be disabled
+    when requests do not reach the network (for example, when replaying
+    archived responses)."""
+    global _enabled
+    _enabled = enabled
+
+
+def cancel_rate_limit_waits() -> None:
+    """Make all limited requests that are waiting for their turn (and all
+    requests that are made from now on) raise RateLimitWaitCancelledError,
+    instead of waiting. Requests that were already sent are not affected.
+    Used on shutdown, since a wait may take longer than the time left."""
+    global _waits_cancelled
+    _waits_cancelled = True
+    for task in list(_waiting):
+        task.cancel()
+
+
+class SharedLimiter:
+    """A drop-in replacement for 'limited.AsyncLimiter' that draws from a
+    token bucket shared with other crawler instances, using the configured
+    rate limit backend. If no backend is configured, or the backend is
+    unavailable, it gracefully falls back to a local (per process) limiter."""
+
+    def __init__(
+        self,
+        key: str,
+        limit: int,
+        every: float,
+        retry_backend_after: float = 60,
+    ) -> None:
+        self._key = key
+        self._limit = limit
+        self._every = every
+        self._local_limiter = AsyncLimiter(limit=limit, every=every)
+        self._retry_backend_after = retry_backend_after
+        self._backend_failed_at: float | None = None
+
+    def __call__(
+        self, func: Callable[ParamsT, Awaitable[ReturnT]]
+    ) -> Callable[ParamsT, Awaitable[ReturnT]]:
+        @wraps(func)
+        async def wrapper(*args: ParamsT.args, **kwargs: ParamsT.kwargs) -> ReturnT:
+            if not _enabled:
+                return await func(*args, **kwargs)
+            if _waits_cancelled:
+                raise RateLimitWaitCancelledError(f"Rate limit '{self._key}'")
+
+            async def call() -> ReturnT:
+                _waiting.discard(waiter)  # the request can't be cancelled anymore
+                return await func(*args, **kwargs)
+
+            # The request waits in a separate task, so that the wait can be
+            # cancelled without cancelling the caller (see cancel_rate_limit_waits).
+            waiter = asyncio.create_task(self._wait_and_call(call))
+            _waiting.add(waiter)
+            waiter.add_done_callback(_waiting.discard)
+            try:
+                return await waiter
+            except asyncio.CancelledError:
+                current_task = asyncio.current_task()
+                if waiter.cancelled() and not (
+                    current_task and current_task.cancelling()
+                ):
+                    raise RateLimitWaitCancelledError(
+                        f"Rate limit '{self._key}'"
+                    ) from None
+                raise
+
+        return wrapper
+
+    async def _wait_and_call(self, call: Callable[[], Awaitable[ReturnT]]) -> ReturnT:
+        if await self._take_shared_token():
+            return await call()
+        return await self._local_limiter(call)()
+
+    async def _take_shared_token(self) -> bool:
+        """Wait until a token is consumed from the shared bucket. Returns False
+        if the shared bucket can't be used, and the local limiter should be used
+        instead."""
+        backend = _backend
+        if backend is None or self._is_backend_cooling_down():
+            return False
+
+        while True:
+            try:
+                wait = await backend.take(self._key, self._limit, self._every)
+            except Exception:
+                logger.warning(
+                    "Shared rate limit '%s' unavailable, using local limiter",
+                    self._key,
+                    exc_info=True,
+                )
+                self._backend_failed_at = time.monotonic()
+                return False
+
+            if not wait:
+                return True
+            await asyncio.sleep(wait)
+
+    def _is_backend_cooling_down(self) -> bool:
+        return (
+            self._backend_failed_at is not None
+            and time.monotonic() - self._backend_failed_at < self._retry_backend_after
+        )
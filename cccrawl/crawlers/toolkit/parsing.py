@@ -0,0 +1,42 @@
+import asyncio
+from collections.abc import Callable
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from types import TracebackType
+from typing import Any, Self, TypeVar
+
+ResultT = TypeVar("ResultT")
+
+
+class ParsingExecutor:
+    """Runs CPU heavy parsing outside of the event loop, so that parsing a
+    large page does not stall other in-flight requests, limiter timers and
+    database writes.
+
+    Parsing functions should accept raw response content, and return plain
+    extracted data. When a process pool is used, both the functions and their
+    results must be picklable (module level functions, builtin types, models).
+    If 'max_workers' is zero, parsing runs inline, on the event loop."""
+
+    def __init__(self, max_workers: int = 2, use_processes: bool = False) -> None:
+        self._executor: Executor | None = None
+        if max_workers > 0:
+            executor_cls = ProcessPoolExecutor if use_processes else ThreadPoolExecutor
+            self._executor = executor_cls(max_workers=max_workers)
+
+    async def __aenter__(self) -> Self:
+        return self
+
+    async def __aexit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+    async def run(self, func: Callable[..., ResultT], *args: Any) -> ResultT:
+        if self._executor is None:
+            return func(*args)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
@@ -1,21 +1,45 @@
 from abc import ABC, abstractmethod
 from collections.abc import AsyncIterable
+from contextlib import AbstractAsyncContextManager
+from typing import NamedTuple, Self
+
+from pydantic import AwareDatetime
 
 from cccrawl.models.any_integration import AnyIntegration
 from cccrawl.models.base import ModelId
+from cccrawl.models.lease import Lease, LeaseKind
 from cccrawl.models.submission import Submission
 
 
+class SubmissionRecord(NamedTuple):
+    """Identifies a submission that is stored in the database."""
+
+    id: ModelId
+    first_seen_at: AwareDatetime
+
+
 class Database(ABC):
     """An abstract database for accessing user information and configurations,
     and storing the solution data."""
 
+    @classmethod
+    @abstractmethod
+    def open_from_env(cls) -> AbstractAsyncContextManager[Self]:
+        """Connect to the database using the configuration provided in the
+        environment variables. The connection is closed when the returned
+        context manager exits."""
+
     @abstractmethod
     def generate_integrations(self) -> AsyncIterable[AnyIntegration]:
         """An infinite generator that should yield all integrations in the
         database, in a cycle. No integrations should be left outside the cycle, and
         newly registered users & integrations should be added at some point."""
 
+    @abstractmethod
+    async def get_integration(self, integration_id: ModelId) -> AnyIntegration | None:
+        """Retrieve the integration with the provided id, or None if there is
+        no such integration."""
+
     @abstractmethod
     async def upsert_integration(self, integration: AnyIntegration) -> None:
         """Update integration details on the database. Used for example to update
@@ -33,3 +57,42 @@ class Database(ABC):
     ) -> AsyncIterable[ModelId]:
         """Retrieve IDs of all previously crawled submissions under the provided
         integration. TODO: optimize."""
+
+    @abstractmethod
+    def get_submission_records(
+        self, integration: AnyIntegration
+    ) -> AsyncIterable[SubmissionRecord]:
+        """Retrieve records of all submissions stored under the provided
+        integration."""
+
+    @abstractmethod
+    def get_pending_submissions(
+        self, integration: AnyIntegration
+    ) -> AsyncIterable[SubmissionRecord]:
+        """Retrieve all submissions under the provided integration that were
+        stored without being finalized (see Submission.finalization_pending)."""
+
+    @abstractmethod
+    async def acquire_lease(self, lease: Lease) -> bool:
+        """Store the provided lease, unless a different owner holds an unexpired
+        lease on the same resource. Returns True if the lease is now held by
+        the provided owner (an owner may renew its own lease). Must be atomic,
+        since several crawler instances may race for the same lease."""
+
+    @abstractmethod
+    async def release_lease(self, lease: Lease) -> None:
+        """Remove the provided lease, if it is still held by its owner."""
+
+    @abstractmethod
+    def get_active_leases(self, kind: LeaseKind) -> AsyncIterable[Lease]:
+        """Retrieve all unexpired leases of the provided kind."""
+
+    @abstractmethod
+    async def take_rate_limit_token(self, key: str, limit: int, every: float) -> float:
+        """Atomically try to consume a token from the shared token bucket with
+        the provided key (see TokenBucket.take). Returns zero if a token was
+        consumed, and otherwise the number of seconds to wait for one."""
+
+    async def flush(self) -> None:
+        """Write all updates that are buffered in memory to the database. The
+        default implementation does nothing, since nothing is buffered."""
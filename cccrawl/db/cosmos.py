@@ -1,26 +1,90 @@
+import asyncio
 import os
-from collections.abc import AsyncIterable
+import time
+from collections.abc import AsyncIterable, AsyncIterator
+from contextlib import asynccontextmanager
+from datetime import datetime
+from enum import auto
 from logging import getLogger
-from typing import Type, TypeVar
+from typing import Any, Self, Type, TypeVar
 
+from azure.core import MatchConditions
+from azure.core.exceptions import AzureError
 from azure.cosmos import PartitionKey
 from azure.cosmos.aio import CosmosClient
+from azure.cosmos.exceptions import (
+    CosmosAccessConditionFailedError,
+    CosmosResourceExistsError,
+    CosmosResourceNotFoundError,
+)
 
-from cccrawl.db.base import Database
+from cccrawl.db.base import Database, SubmissionRecord
+from cccrawl.db.fingerprints import (
+    CoalescedUpdates,
+    Fingerprint,
+    FingerprintCache,
+    document_fingerprint,
+)
 from cccrawl.models.any_integration import AnyIntegration
-from cccrawl.models.base import ModelId
+from cccrawl.models.base import CCBaseStrEnum, ModelId
+from cccrawl.models.lease import Lease, LeaseKind
+from cccrawl.models.rate_limit import TokenBucket
 from cccrawl.models.submission import Submission
+from cccrawl.utils.logs import fields
 
 CosmosDatabaseT = TypeVar("CosmosDatabaseT", bound="CosmosDatabase")
 
 
 logger = getLogger(__name__)
 
+SUBMISSIONS_LAYOUT_CONFIG_ID = "submissions-layout"
+
+# How often (in seconds) the submissions layout is re-read from the configs
+# container, so that a running crawler picks up changes made by the migration.
+SUBMISSIONS_LAYOUT_REFRESH_INTERVAL = 60
+
+
+class SubmissionsLayout(CCBaseStrEnum):
+    """How submissions are stored in the database. Submissions are migrated
+    from the legacy layout to the partitioned layout with the migration
+    command (python -m cccrawl.db.migrate)."""
+
+    # Single 'submissions' container, partitioned by the submission id. Querying
+    # submissions of an integration fans out to all physical partitions.
+    legacy = auto()
+
+    # Migration in progress: submissions are written to both containers, and
+    # read from the legacy container.
+    migrating = auto()
+
+    # 'submissions_by_integration' container, partitioned by the integration id.
+    # Submissions of an integration are queried from a single partition.
+    partitioned = auto()
+
 
 class CosmosDatabase(Database):
+    @classmethod
+    @asynccontextmanager
+    async def open_from_env(cls) -> AsyncIterator[Self]:
+        # Last fetch times of integrations are written in batches, once every
+        # interval (in seconds), instead of once per crawl.
+        last_fetch_flush_interval = float(
+            os.getenv("LAST_FETCH_FLUSH_INTERVAL", default="60")
+        )
+        async with CosmosClient(
+            os.environ["COSMOS_ENDPOINT"], os.environ["COSMOS_KEY"]
+        ) as cosmos_client:
+            db = await cls.init_database(cosmos_client, last_fetch_flush_interval)
+            try:
+                yield db
+            finally:
+                await db.flush()
+
     @classmethod
     async def init_database(
-        cls: Type[CosmosDatabaseT], client: CosmosClient
+        cls: Type[CosmosDatabaseT],
+        client: CosmosClient,
+        last_fetch_flush_interval: float = 0,
     ) -> CosmosDatabaseT:
         db = await client.create_database_if_not_exists(
             id=os.getenv("ENV_NAME", default="dev")
@@ -34,43 +98,411 @@ class CosmosDatabase(Database):
             "submissions", partition_key=PartitionKey("/id")
         )
 
+        # Submission ids are unique per integration as well, so the pair
+        # (integration id, submission id) is the composite key of a submission.
+        partitioned_submissions_container = await db.create_container_if_not_exists(
+            "submissions_by_integration",
+            partition_key=PartitionKey("/integration/id"),
+        )
+
         integrations_container = await db.create_container_if_not_exists(
             "integrations", partition_key=PartitionKey("/id")
         )
 
-        return cls(configs_container, submissions_container, integrations_container)
+        leases_container = await db.create_container_if_not_exists(
+            "leases", partition_key=PartitionKey("/id")
+        )
+
+        rate_limits_container = await db.create_container_if_not_exists(
+            "rate_limits", partition_key=PartitionKey("/id")
+        )
+
+        return cls(
+            configs_container,
+            submissions_container,
+            partitioned_submissions_container,
+            integrations_container,
+            leases_container,
+            rate_limits_container,
+            last_fetch_flush_interval,
+        )
 
     def __init__(
-        self, configs_container, submissions_container, integrations_container
+        self,
+        configs_container,
+        submissions_container,
+        partitioned_submissions_container,
+        integrations_container,
+        leases_container,
+        rate_limits_container,
+        last_fetch_flush_interval: float = 0,
     ) -> None:
         self._configs_container = configs_container
         self._submissions_container = submissions_container
+        self._partitioned_submissions_container = partitioned_submissions_container
         self._integrations_container = integrations_container
+        self._leases_container = leases_container
+        self._rate_limits_container = rate_limits_container
+        self._submissions_layout: SubmissionsLayout | None = None
+        self._submissions_layout_read_at = 0.0
+        self._integration_fingerprints = FingerprintCache()
+        self._last_fetch_updates: CoalescedUpdates[str] = CoalescedUpdates(
+            last_fetch_flush_interval
+        )
 
     async def generate_integrations(self) -> AsyncIterable[AnyIntegration]:
         while True:
             logger.info("Fetching all integrations (new cycle started)")
             async for item in self._integrations_container.read_all_items():
-                integration = AnyIntegration.model_validate(item)
-                yield integration
+                yield self._load_integration(item)
+
+    async def get_integration(self, integration_id: ModelId) -> AnyIntegration | None:
+        try:
+            item = await self._integrations_container.read_item(
+                item=integration_id, partition_key=integration_id
+            )
+        except CosmosResourceNotFoundError:
+            return None
+        return self._load_integration(item)
 
     async def upsert_submission(self, submission: Submission) -> None:
-        logger.info("Upserting submission: %s", submission)
         body = submission.model_dump(mode="json")
-        await self._submissions_container.upsert_item(body=body)
+        started_at = time.perf_counter()
+        for container in await self._get_writable_submissions_containers():
+            await container.upsert_item(body=body)
+        logger.info(
+            "Upserted submission",
+            extra=fields(
+                id=submission.id,
+                integration=submission.integration.id,
+                platform=submission.integration.platform,
+                duration_ms=round((time.perf_counter() - started_at) * 1000),
+            ),
+        )
 
     async def upsert_integration(self, integration: AnyIntegration) -> None:
-        logger.info("Upserting integration: %s", integration.root)
         body = integration.root.model_dump(mode="json")
-        await self._integrations_container.upsert_item(body=body)
+        fingerprint = self._get_integration_fingerprint(body)
+        if self._integration_fingerprints.is_unchanged(
+            integration.root.id, fingerprint
+        ):
+            # Only the last fetch time has changed (if anything): buffer it,
+            # instead of rewriting the whole document.
+            if body["last_fetch"] is not None:
+                self._last_fetch_updates.add(integration.root.id, body["last_fetch"])
+        else:
+            started_at = time.perf_counter()
+            await self._integrations_container.upsert_item(body=body)
+            self._integration_fingerprints.remember(integration.root.id, fingerprint)
+            self._last_fetch_updates.discard(integration.root.id)
+            logger.info(
+                "Upserted integration",
+                extra=fields(
+                    id=integration.root.id,
+                    platform=integration.root.platform,
+                    duration_ms=round((time.perf_counter() - started_at) * 1000),
+                ),
+            )
+
+        if self._last_fetch_updates.is_due():
+            await self.flush()
+
+    async def flush(self) -> None:
+        updates = self._last_fetch_updates.drain()
+        if not updates:
+            return
+
+        logger.info("Flushing last fetch time of %d integrations", len(updates))
+        patches: dict[ModelId, asyncio.Task[bool]] = {}
+        try:
+            async with asyncio.TaskGroup() as tg:
+                for integration_id, last_fetch in updates.items():
+                    patches[integration_id] = tg.create_task(
+                        self._patch_integration_last_fetch(integration_id, last_fetch)
+                    )
+        finally:
+            # Updates that failed (or were cancelled) are retried by the next
+            # flush, so a single failure does not lose the whole batch.
+            for integration_id, last_fetch in updates.items():
+                patch = patches.get(integration_id)
+                if (
+                    patch is None
+                    or patch.cancelled()
+                    or patch.exception() is not None
+                    or not patch.result()
+                ):
+                    self._last_fetch_updates.restore(integration_id, last_fetch)
 
     async def get_collected_submission_ids(
         self, integration: AnyIntegration
     ) -> AsyncIterable[ModelId]:
-        results = self._submissions_container.query_items(
+        results = await self._query_integration_submissions(
+            integration,
             query="SELECT c.id FROM c WHERE c.integration.id = @integration_id",
-            parameters=[{"name": "@integration_id", "value": integration.root.id}],
         )
 
         async for document in results:
             yield ModelId(document["id"])
+
+    async def get_submission_records(
+        self, integration: AnyIntegration
+    ) -> AsyncIterable[SubmissionRecord]:
+        results = await self._query_integration_submissions(
+            integration,
+            query=(
+                "SELECT c.id, c.first_seen_at FROM c "
+                "WHERE c.integration.id = @integration_id"
+            ),
+        )
+
+        async for document in results:
+            yield SubmissionRecord(
+                id=ModelId(document["id"]),
+                first_seen_at=datetime.fromisoformat(document["first_seen_at"]),
+            )
+
+    async def get_pending_submissions(
+        self, integration: AnyIntegration
+    ) -> AsyncIterable[SubmissionRecord]:
+        results = await self._query_integration_submissions(
+            integration,
+            query=(
+                "SELECT c.id, c.first_seen_at FROM c "
+                "WHERE c.integration.id = @integration_id "
+                "AND c.finalization_pending = true"
+            ),
+        )
+
+        async for document in results:
+            yield SubmissionRecord(
+                id=ModelId(document["id"]),
+                first_seen_at=datetime.fromisoformat(document["first_seen_at"]),
+            )
+
+    async def acquire_lease(self, lease: Lease) -> bool:
+        body = lease.model_dump(mode="json")
+        try:
+            current = await self._leases_container.read_item(
+                item=lease.id, partition_key=lease.id
+            )
+        except CosmosResourceNotFoundError:
+            try:
+                await self._leases_container.create_item(body=body)
+            except CosmosResourceExistsError:
+                return False  # another instance created the lease first
+            return True
+
+        held_by = Lease.model_validate(current)
+        if held_by.owner != lease.owner and not held_by.is_expired():
+            return False
+
+        try:
+            # Conditional replace: fails if the lease was modified by another
+            # instance since we have read it.
+            await self._leases_container.replace_item(
+                item=current,
+                body=body,
+                etag=current["_etag"],
+                match_condition=MatchConditions.IfNotModified,
+            )
+        except CosmosAccessConditionFailedError:
+            return False
+        return True
+
+    async def release_lease(self, lease: Lease) -> None:
+        try:
+            current = await self._leases_container.read_item(
+                item=lease.id, partition_key=lease.id
+            )
+            if current["owner"] != lease.owner:
+                return  # lease was already taken over by another instance
+            await self._leases_container.delete_item(
+                item=current,
+                partition_key=lease.id,
+                etag=current["_etag"],
+                match_condition=MatchConditions.IfNotModified,
+            )
+        except (CosmosResourceNotFoundError, CosmosAccessConditionFailedError):
+            pass
+
+    async def get_active_leases(self, kind: LeaseKind) -> AsyncIterable[Lease]:
+        results = self._leases_container.query_items(
+            query="SELECT * FROM c WHERE c.kind = @kind",
+            parameters=[{"name": "@kind", "value": kind.value}],
+        )
+
+        async for document in results:
+            lease = Lease.model_validate(document)
+            if not lease.is_expired():
+                yield lease
+
+    async def take_rate_limit_token(self, key: str, limit: int, every: float) -> float:
+        bucket_id = TokenBucket.full(key, limit, now=0).id
+        while True:
+            now = time.time()
+            try:
+                current = await self._rate_limits_container.read_item(
+                    item=bucket_id, partition_key=bucket_id
+                )
+            except CosmosResourceNotFoundError:
+                bucket = TokenBucket.full(key, limit, now)
+                wait = bucket.take(limit, every, now)
+                try:
+                    await self._rate_limits_container.create_item(
+                        body=bucket.model_dump(mode="json")
+                    )
+                except CosmosResourceExistsError:
+                    continue  # created concurrently by another instance, retry
+                return wait
+
+            bucket = TokenBucket.model_validate(current)
+            wait = bucket.take(limit, every, now)
+            try:
+                await self._rate_limits_container.replace_item(
+                    item=current,
+                    body=bucket.model_dump(mode="json"),
+                    etag=current["_etag"],
+                    match_condition=MatchConditions.IfNotModified,
+                )
+            except CosmosAccessConditionFailedError:
+                continue  # modified concurrently by another instance, retry
+            return wait
+
+    async def get_submissions_layout(self) -> SubmissionsLayout:
+        now = time.monotonic()
+        if (
+            self._submissions_layout is None
+            or now - self._submissions_layout_read_at
+            > SUBMISSIONS_LAYOUT_REFRESH_INTERVAL
+        ):
+            try:
+                config = await self._configs_container.read_item(
+                    item=SUBMISSIONS_LAYOUT_CONFIG_ID,
+                    partition_key=SUBMISSIONS_LAYOUT_CONFIG_ID,
+                )
+                self._submissions_layout = SubmissionsLayout(config["layout"])
+            except CosmosResourceNotFoundError:
+                self._submissions_layout = SubmissionsLayout.legacy
+            self._submissions_layout_read_at = now
+        return self._submissions_layout
+
+    async def set_submissions_layout(self, layout: SubmissionsLayout) -> None:
+        """Switch the layout of all crawlers that use this database. Since the
+        layout is stored in a single document, the switch is atomic, and is
+        picked up by running crawlers within the refresh interval."""
+        logger.info("Switching submissions layout to '%s'", layout)
+        await self._configs_container.upsert_item(
+            body={"id": SUBMISSIONS_LAYOUT_CONFIG_ID, "layout": layout.value}
+        )
+        self._submissions_layout = layout
+        self._submissions_layout_read_at = time.monotonic()
+
+    async def backfill_partitioned_submissions(self, concurrency: int = 32) -> int:
+        """Copy all submissions from the legacy container into the partitioned
+        container, and returns the number of copied submissions. Submissions
+        that already exist in the partitioned container are not overwritten,
+        since they were written (in both containers) after the migration
+        started, and may be newer than the copy that is read here."""
+        queue: asyncio.Queue[dict[str, Any] | None] = asyncio.Queue(maxsize=concurrency)
+        copied = 0
+
+        async def copy_documents() -> None:
+            nonlocal copied
+            while (document := await queue.get()) is not None:
+                body = {k: v for k, v in document.items() if not k.startswith("_")}
+                try:
+                    await self._partitioned_submissions_container.create_item(body=body)
+                    copied += 1
+                except CosmosResourceExistsError:
+                    pass
+
+        async with asyncio.TaskGroup() as tg:
+            for _ in range(concurrency):
+                tg.create_task(copy_documents())
+
+            async for document in self._submissions_container.read_all_items():
+                await queue.put(document)
+
+            for _ in range(concurrency):
+                await queue.put(None)
+
+        return copied
+
+    def _load_integration(self, item: dict[str, Any]) -> AnyIntegration:
+        integration = AnyIntegration.model_validate(item)
+        self._integration_fingerprints.remember(
+            integration.root.id, self._get_integration_fingerprint(item)
+        )
+        if last_fetch := self._last_fetch_updates.get(integration.root.id):
+            # Not flushed yet, the stored value is outdated.
+            integration.root.last_fetch = datetime.fromisoformat(last_fetch)
+        return integration
+
+    async def _patch_integration_last_fetch(
+        self, integration_id: ModelId, last_fetch: str
+    ) -> bool:
+        """Returns False if the update failed, and should be retried."""
+        # A patch sends (and is charged for) the changed property only, instead
+        # of replacing the whole document.
+        try:
+            await self._integrations_container.patch_item(
+                item=integration_id,
+                partition_key=integration_id,
+                patch_operations=[
+                    {
+                        "op": "set",
+                        "path": "/last_fetch",
+                        "value": last_fetch,
+                    }
+                ],
+            )
+        except CosmosResourceNotFoundError:
+            # The integration was removed since it was crawled.
+            self._integration_fingerprints.forget(integration_id)
+        except AzureError:
+            logger.warning(
+                "Failed to update last fetch time of integration %s",
+                integration_id,
+                exc_info=True,
+            )
+            return False
+        return True
+
+    @staticmethod
+    def _get_integration_fingerprint(document: dict[str, Any]) -> Fingerprint:
+        # The last fetch time changes on every crawl, and is patched separately
+        # (see flush). Only whether it is set is part of the fingerprint, so the
+        # first crawl of an integration is written right away.
+        return document_fingerprint(
+            {**document, "last_fetch": document.get("last_fetch") is not None}
+        )
+
+    async def _get_writable_submissions_containers(self) -> list[Any]:
+        match await self.get_submissions_layout():
+            case SubmissionsLayout.legacy:
+                return [self._submissions_container]
+            case SubmissionsLayout.migrating:
+                return [
+                    self._submissions_container,
+                    self._partitioned_submissions_container,
+                ]
+            case SubmissionsLayout.partitioned:
+                return [self._partitioned_submissions_container]
+            case layout:
+                raise ValueError(f"Unknown submissions layout: {layout}")
+
+    async def _query_integration_submissions(
+        self, integration: AnyIntegration, query: str
+    ) -> AsyncIterable[dict[str, Any]]:
+        parameters = [{"name": "@integration_id", "value": integration.root.id}]
+        if await self.get_submissions_layout() == SubmissionsLayout.partitioned:
+            # Single partition query.
+            return self._partitioned_submissions_container.query_items(
+                query=query,
+                parameters=parameters,
+                partition_key=integration.root.id,
+            )
+
+        return self._submissions_container.query_items(
+            query=query, parameters=parameters
+        )
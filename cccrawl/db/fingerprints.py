@@ -0,0 +1,93 @@
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from collections.abc import Mapping
+from typing import Any, Generic, TypeVar
+
+from cccrawl.models.base import ModelId
+
+try:
+    import orjson
+except ImportError:  # optional, a faster JSON encoder
+    orjson = None  # type: ignore[assignment]
+
+ValueT = TypeVar("ValueT")
+
+Fingerprint = bytes
+
+
+def document_fingerprint(document: Mapping[str, Any]) -> Fingerprint:
+    """Returns a short digest of the provided JSON document. System properties
+    (keys that start with an underscore, such as Cosmos '_etag') are ignored,
+    so a document read from the database has the fingerprint of the document
+    that was written."""
+    content = {key: value for key, value in document.items() if key[:1] != "_"}
+    if orjson is not None:
+        encoded = orjson.dumps(content, option=orjson.OPT_SORT_KEYS)
+    else:
+        encoded = json.dumps(content, sort_keys=True, separators=(",", ":")).encode()
+    return hashlib.blake2b(encoded, digest_size=16).digest()
+
+
+class FingerprintCache:
+    """Remembers the fingerprint of the last document that was written to (or
+    read from) the database, by document id, so writes that would not change
+    the stored document can be skipped. If a maximal size is provided, the
+    least recently used fingerprints are evicted."""
+
+    def __init__(self, max_size: int | None = None) -> None:
+        self._fingerprints: OrderedDict[ModelId, Fingerprint] = OrderedDict()
+        self._max_size = max_size
+
+    def is_unchanged(self, id: ModelId, fingerprint: Fingerprint) -> bool:
+        if self._fingerprints.get(id) != fingerprint:
+            return False
+        self._fingerprints.move_to_end(id)
+        return True
+
+    def remember(self, id: ModelId, fingerprint: Fingerprint) -> None:
+        self._fingerprints[id] = fingerprint
+        self._fingerprints.move_to_end(id)
+        if self._max_size is not None and len(self._fingerprints) > self._max_size:
+            self._fingerprints.popitem(last=False)
+
+    def forget(self, id: ModelId) -> None:
+        self._fingerprints.pop(id, None)
+
+
+class CoalescedUpdates(Generic[ValueT]):
+    """Buffers the latest value of a field by document id, to be written to the
+    database in periodic batches instead of once per update. A flush interval
+    of zero disables buffering: every update is due immediately."""
+
+    def __init__(self, flush_interval: float) -> None:
+        self._flush_interval = flush_interval
+        self._updates: dict[ModelId, ValueT] = {}
+        self._flushed_at = time.monotonic()
+
+    def __len__(self) -> int:
+        return len(self._updates)
+
+    def get(self, id: ModelId) -> ValueT | None:
+        return self._updates.get(id)
+
+    def add(self, id: ModelId, value: ValueT) -> None:
+        self._updates[id] = value
+
+    def restore(self, id: ModelId, value: ValueT) -> None:
+        """Buffer a value that failed to be written again, unless a newer value
+        was buffered since it was drained."""
+        self._updates.setdefault(id, value)
+
+    def discard(self, id: ModelId) -> None:
+        if id in self._updates:
+            del self._updates[id]
+
+    def is_due(self) -> bool:
+        return time.monotonic() - self._flushed_at >= self._flush_interval
+
+    def drain(self) -> dict[ModelId, ValueT]:
+        updates, self._updates = self._updates, {}
+        self._flushed_at = time.monotonic()
+        return updates
@@ -0,0 +1,48 @@
+"""Migrate the stored submissions to the container partitioned by integration
+id, while crawlers keep running. Usage: python -m cccrawl.db.migrate
+
+The migration first switches all crawlers to write submissions to both
+containers, then copies existing submissions in bulk, and finally switches
+reads (and writes) over to the partitioned container."""
+
+import asyncio
+import logging
+
+from dotenv import load_dotenv
+
+from cccrawl.db.cosmos import (
+    SUBMISSIONS_LAYOUT_REFRESH_INTERVAL,
+    CosmosDatabase,
+    SubmissionsLayout,
+)
+
+logger = logging.getLogger(__name__)
+
+
+async def migrate_submissions(db: CosmosDatabase, concurrency: int = 32) -> None:
+    if await db.get_submissions_layout() == SubmissionsLayout.partitioned:
+        logger.info("Submissions are already partitioned by integration id")
+        return
+
+    await db.set_submissions_layout(SubmissionsLayout.migrating)
+
+    # Wait for all running crawlers to pick up the new layout, so that no
+    # submission is written only to the legacy container after it is copied.
+    logger.info("Waiting for crawlers to start writing to both containers")
+    await asyncio.sleep(2 * SUBMISSIONS_LAYOUT_REFRESH_INTERVAL)
+
+    copied = await db.backfill_partitioned_submissions(concurrency)
+    logger.info("Copied %d submissions to the partitioned container", copied)
+
+    await db.set_submissions_layout(SubmissionsLayout.partitioned)
+
+
+async def main() -> None:
+    async with CosmosDatabase.open_from_env() as db:
+        await migrate_submissions(db)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    load_dotenv()
+    asyncio.run(main())
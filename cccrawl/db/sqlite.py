@@ -0,0 +1,250 @@
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+from collections.abc import AsyncIterable, AsyncIterator, Callable
+from contextlib import asynccontextmanager
+from datetime import datetime
+from logging import getLogger
+from typing import Any, Self, TypeVar
+
+from cccrawl.db.base import Database, SubmissionRecord
+from cccrawl.models.any_integration import AnyIntegration
+from cccrawl.models.base import ModelId
+from cccrawl.models.lease import Lease, LeaseKind
+from cccrawl.models.rate_limit import TokenBucket
+from cccrawl.models.submission import Submission
+from cccrawl.utils import current_datetime
+from cccrawl.utils.logs import fields
+
+ResultT = TypeVar("ResultT")
+
+logger = getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS integrations (
+    id TEXT PRIMARY KEY,
+    body TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS submissions (
+    id TEXT PRIMARY KEY,
+    integration_id TEXT NOT NULL,
+    body TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS submissions_by_integration
+    ON submissions (integration_id);
+CREATE TABLE IF NOT EXISTS leases (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    owner TEXT NOT NULL,
+    expires_at REAL NOT NULL,
+    body TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS rate_limits (
+    id TEXT PRIMARY KEY,
+    body TEXT NOT NULL
+);
+"""
+
+
+class SqliteDatabase(Database):
+    """A single file database, intended as a local stand-in for Cosmos during
+    development. Several crawler processes may share the same database file,
+    which makes it possible to run a small crawler cluster locally."""
+
+    def __init__(self, path: str | os.PathLike[str] = ":memory:") -> None:
+        # Autocommit mode: transactions are managed explicitly where needed.
+        self._connection = sqlite3.connect(
+            path, timeout=30, isolation_level=None, check_same_thread=False
+        )
+        self._lock = threading.Lock()
+        self._connection.executescript(SCHEMA)
+
+    @classmethod
+    @asynccontextmanager
+    async def open_from_env(cls) -> AsyncIterator[Self]:
+        db = cls(os.getenv("SQLITE_PATH", default="cccrawl.sqlite3"))
+        try:
+            yield db
+        finally:
+            db.close()
+
+    def close(self) -> None:
+        self._connection.close()
+
+    async def generate_integrations(self) -> AsyncIterable[AnyIntegration]:
+        while True:
+            logger.info("Fetching all integrations (new cycle started)")
+            rows = await self._fetch_all("SELECT body FROM integrations")
+            for (body,) in rows:
+                yield AnyIntegration.model_validate_json(body)
+
+    async def get_integration(self, integration_id: ModelId) -> AnyIntegration | None:
+        rows = await self._fetch_all(
+            "SELECT body FROM integrations WHERE id = ?", integration_id
+        )
+        if not rows:
+            return None
+        return AnyIntegration.model_validate_json(rows[0][0])
+
+    async def upsert_submission(self, submission: Submission) -> None:
+        started_at = time.perf_counter()
+        await self._execute(
+            "INSERT OR REPLACE INTO submissions VALUES (?, ?, ?)",
+            submission.id,
+            submission.integration.id,
+            submission.model_dump_json(),
+        )
+        logger.info(
+            "Upserted submission",
+            extra=fields(
+                id=submission.id,
+                integration=submission.integration.id,
+                platform=submission.integration.platform,
+                duration_ms=round((time.perf_counter() - started_at) * 1000),
+            ),
+        )
+
+    async def upsert_integration(self, integration: AnyIntegration) -> None:
+        started_at = time.perf_counter()
+        await self._execute(
+            "INSERT OR REPLACE INTO integrations VALUES (?, ?)",
+            integration.root.id,
+            integration.root.model_dump_json(),
+        )
+        logger.info(
+            "Upserted integration",
+            extra=fields(
+                id=integration.root.id,
+                platform=integration.root.platform,
+                duration_ms=round((time.perf_counter() - started_at) * 1000),
+            ),
+        )
+
+    async def get_collected_submission_ids(
+        self, integration: AnyIntegration
+    ) -> AsyncIterable[ModelId]:
+        rows = await self._fetch_all(
+            "SELECT id FROM submissions WHERE integration_id = ?",
+            integration.root.id,
+        )
+        for (submission_id,) in rows:
+            yield ModelId(submission_id)
+
+    async def get_submission_records(
+        self, integration: AnyIntegration
+    ) -> AsyncIterable[SubmissionRecord]:
+        rows = await self._fetch_all(
+            "SELECT id, json_extract(body, '$.first_seen_at') FROM submissions "
+            "WHERE integration_id = ?",
+            integration.root.id,
+        )
+        for submission_id, first_seen_at in rows:
+            yield SubmissionRecord(
+                id=ModelId(submission_id),
+                first_seen_at=datetime.fromisoformat(first_seen_at),
+            )
+
+    async def get_pending_submissions(
+        self, integration: AnyIntegration
+    ) -> AsyncIterable[SubmissionRecord]:
+        rows = await self._fetch_all(
+            "SELECT id, json_extract(body, '$.first_seen_at') FROM submissions "
+            "WHERE integration_id = ? "
+            "AND json_extract(body, '$.finalization_pending') = 1",
+            integration.root.id,
+        )
+        for submission_id, first_seen_at in rows:
+            yield SubmissionRecord(
+                id=ModelId(submission_id),
+                first_seen_at=datetime.fromisoformat(first_seen_at),
+            )
+
+    async def acquire_lease(self, lease: Lease) -> bool:
+        return await self._run(self._acquire_lease, lease)
+
+    async def release_lease(self, lease: Lease) -> None:
+        await self._execute(
+            "DELETE FROM leases WHERE id = ? AND owner = ?", lease.id, lease.owner
+        )
+
+    async def get_active_leases(self, kind: LeaseKind) -> AsyncIterable[Lease]:
+        rows = await self._fetch_all(
+            "SELECT body FROM leases WHERE kind = ? AND expires_at > ?",
+            kind.value,
+            current_datetime().timestamp(),
+        )
+        for (body,) in rows:
+            yield Lease.model_validate_json(body)
+
+    async def take_rate_limit_token(self, key: str, limit: int, every: float) -> float:
+        return await self._run(self._take_rate_limit_token, key, limit, every)
+
+    def _acquire_lease(self, lease: Lease) -> bool:
+        # BEGIN IMMEDIATE takes the database write lock right away, so the
+        # check and the write below are atomic across processes.
+        self._connection.execute("BEGIN IMMEDIATE")
+        try:
+            row = self._connection.execute(
+                "SELECT owner, expires_at FROM leases WHERE id = ?", (lease.id,)
+            ).fetchone()
+            if row is not None:
+                owner, expires_at = row
+                if owner != lease.owner and expires_at > current_datetime().timestamp():
+                    self._connection.execute("ROLLBACK")
+                    return False
+
+            self._connection.execute(
+                "INSERT OR REPLACE INTO leases VALUES (?, ?, ?, ?, ?)",
+                (
+                    lease.id,
+                    lease.kind.value,
+                    lease.owner,
+                    lease.expires_at.timestamp(),
+                    lease.model_dump_json(),
+                ),
+            )
+        except BaseException:
+            self._connection.execute("ROLLBACK")
+            raise
+        self._connection.execute("COMMIT")
+        return True
+
+    def _take_rate_limit_token(self, key: str, limit: int, every: float) -> float:
+        self._connection.execute("BEGIN IMMEDIATE")
+        try:
+            now = time.time()
+            bucket = TokenBucket.full(key, limit, now)
+            row = self._connection.execute(
+                "SELECT body FROM rate_limits WHERE id = ?", (bucket.id,)
+            ).fetchone()
+            if row is not None:
+                bucket = TokenBucket.model_validate_json(row[0])
+
+            wait = bucket.take(limit, every, now)
+            self._connection.execute(
+                "INSERT OR REPLACE INTO rate_limits VALUES (?, ?)",
+                (bucket.id, bucket.model_dump_json()),
+            )
+        except BaseException:
+            self._connection.execute("ROLLBACK")
+            raise
+        self._connection.execute("COMMIT")
+        return wait
+
+    async def _execute(self, sql: str, *params: Any) -> None:
+        await self._run(self._connection.execute, sql, params)
+
+    async def _fetch_all(self, sql: str, *params: Any) -> list[Any]:
+        return await self._run(lambda: self._connection.execute(sql, params).fetchall())
+
+    async def _run(self, func: Callable[..., ResultT], *args: Any) -> ResultT:
+        """Run a blocking sqlite operation in a worker thread, without blocking
+        the event loop. Operations on the shared connection are serialized."""
+
+        def run_locked() -> ResultT:
+            with self._lock:
+                return func(*args)
+
+        return await asyncio.to_thread(run_locked)
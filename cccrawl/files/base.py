@@ -1,6 +1,7 @@
 from abc import ABC, abstractmethod
-from typing import TextIO
+from typing import Self, TextIO
 
+from httpx import AsyncClient
 from pydantic import HttpUrl
 
 
@@ -8,6 +9,13 @@ class FileUploadService(ABC):
     """An abstract implementation of a file upload service. Uploaded files
     should be publicly available."""
 
+    @classmethod
+    def from_env(cls, client: AsyncClient) -> Self:
+        """Create an upload service instance that sends requests using the
+        provided client, reading any additional configuration it requires from
+        the environment variables."""
+        return cls()
+
     @abstractmethod
     async def upload(self, content: TextIO) -> HttpUrl:
         """Upload the provided file content to a publicly available file
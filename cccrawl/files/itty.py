@@ -1,25 +1,38 @@
-from typing import TextIO
+import os
+from typing import Self, TextIO
 
-from httpx import AsyncClient, HTTPStatusError
+from httpx import AsyncClient, HTTPStatusError, Response
 from pydantic import HttpUrl
 
 from cccrawl.files.base import FileUploadError, FileUploadService
 
 
 class IttyUploadService(FileUploadService):
-    def __init__(self, key_length: int = 8, time_to_live: str = "30years") -> None:
+    def __init__(
+        self,
+        key_length: int = 8,
+        time_to_live: str = "30years",
+        client: AsyncClient | None = None,
+    ) -> None:
         # WARNING: There is no argument validation here!
         # not implemented since it is kind messy and time consuming.
         self._key_length = key_length
         self._time_to_live = time_to_live
+        self._client = client
+
+    @classmethod
+    def from_env(cls, client: AsyncClient) -> Self:
+        return cls(
+            key_length=int(os.getenv("ITTY_KEY_LENGTH", default="16")),
+            client=client,
+        )
 
     async def upload(self, content: TextIO) -> HttpUrl:
-        async with AsyncClient() as client:
-            response = await client.post(
-                url="https://ity.sh/",
-                params={"ttl": self._time_to_live, "length": self._key_length},
-                json=content.read(),
-            )
+        if self._client is not None:
+            response = await self._post_file(self._client, content)
+        else:
+            async with AsyncClient() as client:
+                response = await self._post_file(client, content)
 
         try:
             response.raise_for_status()
@@ -28,3 +41,10 @@ class IttyUploadService(FileUploadService):
 
         url: str = response.json()["url"]
         return HttpUrl(url)
+
+    async def _post_file(self, client: AsyncClient, content: TextIO) -> Response:
+        return await client.post(
+            url="https://ity.sh/",
+            params={"ttl": self._time_to_live, "length": self._key_length},
+            json=content.read(),
+        )
@@ -0,0 +1,106 @@
+from abc import ABC, abstractmethod
+from collections.abc import Callable
+from enum import auto
+from typing import TypeAlias
+
+from cccrawl.models.base import CCBaseStrEnum, ModelId
+from cccrawl.models.submission import CrawledSubmission, SubmissionVerdict
+
+
+class FinalizationDecision(CCBaseStrEnum):
+    # Finalize the submission now.
+    finalize = auto()
+
+    # Store the submission as pending, to be considered again in a later crawl.
+    defer = auto()
+
+    # Store the submission without finalizing it (marked as skipped), and never
+    # consider it again.
+    skip = auto()
+
+
+SubmissionDecider: TypeAlias = Callable[[CrawledSubmission], FinalizationDecision]
+
+
+class FinalizationPolicy(ABC):
+    """Decides which new submissions are finalized (which may require
+    expensive, rate limited requests). Deferred submissions are stored as
+    pending, and are considered again in later crawls of the integration.
+    Skipped submissions are stored as they were crawled, marked as skipped
+    (see Submission.finalization_skipped), and are never finalized."""
+
+    @abstractmethod
+    def start_crawl(self) -> SubmissionDecider:
+        """Called at the start of every crawl of an integration. The returned
+        function is called with the new and pending submissions of the crawl,
+        in the order they are yielded by the crawler, and decides what to do
+        with every submission."""
+
+
+class FinalizeAll(FinalizationPolicy):
+    def start_crawl(self) -> SubmissionDecider:
+        return lambda submission: FinalizationDecision.finalize
+
+
+class FinalizeAccepted(FinalizationPolicy):
+    """Finalize only accepted submissions. Rejected submissions are stored
+    without finalization."""
+
+    def start_crawl(self) -> SubmissionDecider:
+        def decide(submission: CrawledSubmission) -> FinalizationDecision:
+            if submission.verdict != SubmissionVerdict.accepted:
+                return FinalizationDecision.skip
+            return FinalizationDecision.finalize
+
+        return decide
+
+
+class FinalizeLatestAccepted(FinalizationPolicy):
+    """Finalize only the latest accepted submission of every problem. Crawlers
+    yield the most recent submissions first, so older accepted submissions of
+    a problem (and rejected submissions) are stored without finalization."""
+
+    def start_crawl(self) -> SubmissionDecider:
+        seen_problems: set[ModelId] = set()
+
+        def decide(submission: CrawledSubmission) -> FinalizationDecision:
+            if submission.verdict != SubmissionVerdict.accepted:
+                return FinalizationDecision.skip
+            if submission.problem.id in seen_problems:
+                return FinalizationDecision.skip
+            seen_problems.add(submission.problem.id)
+            return FinalizationDecision.finalize
+
+        return decide
+
+
+class FinalizeWithinBudget(FinalizationPolicy):
+    """Finalize at most 'budget' submissions in every crawl of an integration,
+    and only those that are approved by the wrapped policy. Approved
+    submissions over the budget are deferred to later crawls.
+    The budget is per integration rather than shared by a whole cycle:
+    integrations are crawled in the same order in every cycle, so a shared
+    budget would be used up by the first integrations of every cycle, and
+    the submissions of the others would be deferred forever. The fetches of
+    a cycle are still bounded, by the budget times the number of
+    integrations."""
+
+    def __init__(self, budget: int, policy: FinalizationPolicy = FinalizeAll()) -> None:
+        self._budget = budget
+        self._policy = policy
+
+    def start_crawl(self) -> SubmissionDecider:
+        policy_decide = self._policy.start_crawl()
+        remaining = self._budget
+
+        def decide(submission: CrawledSubmission) -> FinalizationDecision:
+            nonlocal remaining
+            decision = policy_decide(submission)
+            if decision != FinalizationDecision.finalize:
+                return decision
+            if remaining <= 0:
+                return FinalizationDecision.defer
+            remaining -= 1
+            return FinalizationDecision.finalize
+
+        return decide
@@ -1,6 +1,7 @@
+from functools import cached_property
 from typing import Annotated, Literal
 
-from pydantic import StringConstraints, computed_field
+from pydantic import AwareDatetime, StringConstraints, computed_field
 
 from cccrawl.models.base import ModelId
 from cccrawl.models.integration import Integration, Platform
@@ -12,7 +13,11 @@ class CodeforcesIntegration(Integration):
         str, StringConstraints(to_lower=True, min_length=3, max_length=30)
     ]
 
+    # The last time the full submission history of the user was downloaded. Set
+    # only if the crawler checks the activity of users before downloading it.
+    last_history_fetch: AwareDatetime | None = None
+
     @computed_field  # type: ignore[misc]
-    @property
+    @cached_property
     def id(self) -> ModelId:
         return ModelId(self._hash_tokens(self.platform.value, self.handle))
@@ -1,3 +1,4 @@
+from functools import cached_property
 from typing import Annotated, Literal
 
 from pydantic import Field, StringConstraints, computed_field
@@ -19,6 +20,6 @@ class CsesIntegration(Integration):
     ]
 
     @computed_field  # type: ignore[misc]
-    @property
+    @cached_property
     def id(self) -> ModelId:
         return ModelId(self._hash_tokens(self.platform.value, self.user_number))
@@ -1,29 +1,128 @@
-from asyncio import TaskGroup
-from collections.abc import AsyncIterable, Mapping
+from asyncio import (
+    FIRST_COMPLETED,
+    CancelledError,
+    Event,
+    Queue,
+    TaskGroup,
+    create_task,
+    wait,
+)
+from collections import defaultdict, deque
+from collections.abc import AsyncIterable, Collection, Mapping
+from contextlib import suppress
 from logging import getLogger
+from typing import NamedTuple
+
+from pydantic import AwareDatetime
 
 from cccrawl.crawlers.base import AnyCrawler
+from cccrawl.crawlers.toolkit.archive import ArchiveMissError
+from cccrawl.crawlers.toolkit.limits import (
+    RateLimitWaitCancelledError,
+    cancel_rate_limit_waits,
+)
 from cccrawl.db.base import Database
+from cccrawl.finalization import FinalizationDecision, FinalizationPolicy, FinalizeAll
 from cccrawl.models.any_integration import AnyIntegration
+from cccrawl.models.base import ModelId
 from cccrawl.models.integration import Platform
 from cccrawl.models.submission import CrawledSubmission
+from cccrawl.sharding import ShardCoordinator
+from cccrawl.utils import current_datetime
 
 logger = getLogger(__name__)
 
 
+class FinalizationJob(NamedTuple):
+    crawled_submission: CrawledSubmission
+    is_first_scan: bool
+    decision: FinalizationDecision
+    pending_since: AwareDatetime | None
+
+
+class CrawlerStatus(NamedTuple):
+    current_integration: ModelId | None
+    current_since: AwareDatetime | None
+    requested_integrations: list[ModelId]  # in the order they will be crawled
+    processed_integrations: int
+    requested_crawls: int
+
+
 class MainCrawler:
     def __init__(
         self,
         db: Database,
         crawlers: Mapping[Platform, AnyCrawler],
+        shards: ShardCoordinator | None = None,
+        finalization_policy: FinalizationPolicy = FinalizeAll(),
+        max_concurrent_finalizations: int = 16,
     ) -> None:
+        if max_concurrent_finalizations < 1:
+            raise ValueError("At least a single concurrent finalization is required")
+
         self._db = db
         self._crawlers = crawlers
+        self._shards = shards
+        self._finalization_policy = finalization_policy
+        self._max_concurrent_finalizations = max_concurrent_finalizations
+
+        # Integrations that were requested to be crawled (see request_crawl).
+        # They are crawled before the next integration of the cycle, and are
+        # skipped by the cycle if it did not pass them yet (by id, the number
+        # of the cycle in which they were crawled on request).
+        self._requested: deque[ModelId] = deque()
+        self._crawled_on_request: dict[ModelId, int] = {}
+
+        # Number of the current cycle of integrations, and the integrations
+        # that were already yielded in it.
+        self._cycle = 0
+        self._cycle_integrations: set[ModelId] = set()
+
+        self._current_integration: ModelId | None = None
+        self._current_since: AwareDatetime | None = None
+        self._processed_integrations = 0
+        self._requested_crawls = 0
+        self._stopping = Event()
+
+    def stop(self) -> None:
+        """Stop crawling gracefully: no more integrations are crawled, and
+        submissions of the current integration that were not finalized yet are
+        stored as pending (to be finalized after a restart), without waiting
+        for any additional (rate limited) requests. Finalizations that are
+        already in progress are completed, unless they wait for a rate limit."""
+        logger.info("Stopping: finishing the current integration")
+        self._stopping.set()
+        cancel_rate_limit_waits()
+
+    async def close(self) -> None:
+        async with TaskGroup() as tg:
+            for crawler in self._crawlers.values():
+                tg.create_task(crawler.close())
+
+    def request_crawl(self, integration_id: ModelId) -> int:
+        """Queue the integration to be crawled as soon as possible, before
+        the next integration of the cycle. Returns its position in the queue
+        (starting from 1)."""
+        if integration_id not in self._requested:
+            self._requested.append(integration_id)
+        return self._requested.index(integration_id) + 1
+
+    def status(self) -> CrawlerStatus:
+        return CrawlerStatus(
+            current_integration=self._current_integration,
+            current_since=self._current_since,
+            requested_integrations=list(self._requested),
+            processed_integrations=self._processed_integrations,
+            requested_crawls=self._requested_crawls,
+        )
 
     async def crawl_integration_new_submissions(
-        self, integration: AnyIntegration
+        self,
+        integration: AnyIntegration,
+        pending_ids: Collection[ModelId] = (),
     ) -> AsyncIterable[CrawledSubmission]:
-        """Yields all submissions that are new and do not appear in the database."""
+        """Yields all submissions that are new and do not appear in the database,
+        and submissions that are stored but are still pending finalization."""
 
         seen_ids = set()
         async for submission_id in self._db.get_collected_submission_ids(integration):
@@ -32,56 +131,266 @@ class MainCrawler:
         crawler = self._get_crawler_for_integration(integration)
 
         async for crawled_submission in crawler.crawl(integration.root):
-            if crawled_submission.id not in seen_ids:
+            if (
+                crawled_submission.id not in seen_ids
+                or crawled_submission.id in pending_ids
+            ):
                 yield crawled_submission
 
     async def crawl_integration_and_update_db(
         self, integration: AnyIntegration
     ) -> None:
-        new_submissions_gen = self.crawl_integration_new_submissions(integration)
+        pending = {
+            pending_submission.id: pending_submission.first_seen_at
+            async for pending_submission in self._db.get_pending_submissions(
+                integration
+            )
+        }
+        new_submissions_gen = self.crawl_integration_new_submissions(
+            integration, pending_ids=pending.keys()
+        )
         crawler = self._get_crawler_for_integration(integration)
+        decide = self._finalization_policy.start_crawl()
 
         is_first_scan = integration.root.last_fetch is None
         integration.root.update_last_fetched()  # update now to show time of start of crawling
 
+        # A fixed pool of workers finalizes the submissions. The queue is
+        # bounded, so the crawler generator is paused while all workers are
+        # busy, and the number of in-flight submissions stays constant no
+        # matter how many new submissions the integration has.
+        queue: Queue[FinalizationJob | None] = Queue(
+            maxsize=self._max_concurrent_finalizations
+        )
+
         async with TaskGroup() as tg:
-            async for crawled_submission in new_submissions_gen:
-                tg.create_task(
-                    self._finalize_submission_and_update_db(
-                        crawler,
-                        crawled_submission,
-                        is_first_scan,
+            for _ in range(self._max_concurrent_finalizations):
+                tg.create_task(self._finalization_worker(crawler, queue))
+
+            listing_stopped = False
+            try:
+                async for crawled_submission in new_submissions_gen:
+                    await queue.put(
+                        FinalizationJob(
+                            crawled_submission=crawled_submission,
+                            is_first_scan=is_first_scan,
+                            decision=decide(crawled_submission),
+                            pending_since=pending.get(crawled_submission.id),
+                        )
                     )
+            except RateLimitWaitCancelledError:
+                if not self._stopping.is_set():
+                    raise
+                # Stopped while waiting for a rate limited listing request. The
+                # submissions that were listed so far are still stored.
+                logger.info(
+                    "Stopped listing submissions of integration %s (shutting down)",
+                    integration,
                 )
+                listing_stopped = True
 
+            for _ in range(self._max_concurrent_finalizations):
+                await queue.put(None)  # signal workers that crawling is done
+
+        if listing_stopped and is_first_scan:
+            # Not stored, so the first scan runs again (without finalizing the
+            # old submissions) after the restart.
+            return
         await self._db.upsert_integration(integration)
 
     async def crawl(self) -> None:
         await self._load_all_crawlers()
+        await self._index_all_integrations()
         integrations = self._db.generate_integrations()
         async for integration in integrations:
+            if integration.root.id in self._cycle_integrations:
+                self._start_cycle()
+            self._cycle_integrations.add(integration.root.id)
+
+            await self._crawl_requested_integrations()
+            if self._stopping.is_set():
+                break
+
+            if self._crawled_on_request.pop(integration.root.id, None) == self._cycle:
+                continue  # crawled on request during the current cycle
+
+            await self._crawl_integration(integration)
+
+    async def _crawl_requested_integrations(self) -> None:
+        while self._requested and not self._stopping.is_set():
+            integration_id = self._requested.popleft()
+            integration = await self._db.get_integration(integration_id)
+            if integration is None:
+                logger.warning("Requested integration %s not found", integration_id)
+                continue
+
+            self._requested_crawls += 1
+            self._crawled_on_request[integration_id] = self._cycle
+            await self._crawl_integration(integration, assigned_only=False)
+
+    def _start_cycle(self) -> None:
+        self._cycle += 1
+        self._cycle_integrations.clear()
+
+        # Integrations that were crawled on request in an earlier cycle (after
+        # that cycle passed them) are crawled by the new cycle as usual, so
+        # no entry of an earlier cycle is needed anymore.
+        self._crawled_on_request.clear()
+
+    async def _crawl_integration(
+        self, integration: AnyIntegration, assigned_only: bool = True
+    ) -> None:
+        if integration.root.platform not in self._crawlers:
+            return  # platform is not enabled in this deployment
+
+        crawler = self._get_crawler_for_integration(integration)
+        self._current_integration = integration.root.id
+        self._current_since = current_datetime()
+        try:
+            if not await crawler.should_crawl(integration.root):
+                return
+            await self._crawl_integration_if_owned(integration, assigned_only)
+        except Exception as error:
+            if (
+                isinstance(error, RateLimitWaitCancelledError)
+                and self._stopping.is_set()
+            ):
+                # Stopped while waiting for a rate limited request.
+                logger.info(
+                    "Stopped crawling integration %s (shutting down)", integration
+                )
+            else:
+                logger.error(
+                    "Failed to crawl integration %s",
+                    integration,
+                    exc_info=True,
+                )
+        finally:
+            self._current_integration = None
+            self._current_since = None
+            self._processed_integrations += 1
+
+    async def reprocess(self) -> None:
+        """Re-crawl and re-finalize all stored submissions of every integration
+        (in a single cycle), and update the stored submissions. Intended to run
+        against archived responses, after a parser has changed."""
+        await self._load_all_crawlers()
+        reprocessed_ids = set()
+        async for integration in self._db.generate_integrations():
+            if self._stopping.is_set():
+                break
+            if integration.root.id in reprocessed_ids:
+                break  # completed a full cycle of all integrations
+            reprocessed_ids.add(integration.root.id)
+
+            if integration.root.platform not in self._crawlers:
+                continue  # platform is not enabled in this deployment
+
             try:
-                await self.crawl_integration_and_update_db(integration)
+                await self.reprocess_integration(integration)
+            except ArchiveMissError as error:
+                logger.warning(
+                    "Integration %s can not be reprocessed: %s", integration, error
+                )
             except Exception:
                 logger.error(
-                    "Failed to crawl integration %s",
+                    "Failed to reprocess integration %s",
                     integration,
                     exc_info=True,
                 )
 
+    async def reprocess_integration(self, integration: AnyIntegration) -> None:
+        crawler = self._get_crawler_for_integration(integration)
+        stored = {
+            record.id: record.first_seen_at
+            async for record in self._db.get_submission_records(integration)
+        }
+
+        async for crawled_submission in crawler.crawl(integration.root):
+            if (first_seen_at := stored.get(crawled_submission.id)) is None:
+                continue  # only stored submissions are reprocessed
+
+            try:
+                submission = await crawler.finalize_new_submission(crawled_submission)
+            except ArchiveMissError:
+                # The submission was not finalized when it was crawled (or the
+                # archive did not exist yet). Keep the stored submission.
+                continue
+
+            submission.first_seen_at = first_seen_at
+            await self._db.upsert_submission(submission)
+
+    async def _crawl_integration_if_owned(
+        self, integration: AnyIntegration, assigned_only: bool = True
+    ) -> None:
+        if self._shards is None:
+            await self.crawl_integration_and_update_db(integration)
+            return
+
+        lease = await self._shards.claim(integration, assigned_only)
+        if lease is None:
+            return  # integration is handled by another crawler instance
+
+        renewal = create_task(self._shards.keep_alive(lease))
+        crawl = create_task(self.crawl_integration_and_update_db(integration))
+        try:
+            await wait((renewal, crawl), return_when=FIRST_COMPLETED)
+            if crawl.done():
+                crawl.result()  # raise the error of the crawl, if any
+            else:
+                # The lease was taken by another crawler instance, which now
+                # crawls the integration. Stop, without storing the integration.
+                logger.warning(
+                    "Stopped crawling integration %s, its lease was lost",
+                    integration,
+                )
+        finally:
+            for task in (crawl, renewal):
+                if not task.done():
+                    task.cancel()
+                    with suppress(CancelledError):
+                        await task
+            await self._shards.release(lease)
+
     async def _load_all_crawlers(self) -> None:
         async with TaskGroup() as tg:
             for crawler in self._crawlers.values():
                 tg.create_task(crawler.load())
 
+    async def _index_all_integrations(self) -> None:
+        integrations: dict[Platform, list] = defaultdict(list)
+        seen_ids = set()
+        async for integration in self._db.generate_integrations():
+            if integration.root.id in seen_ids:
+                break  # read a full cycle of all integrations
+            seen_ids.add(integration.root.id)
+            integrations[integration.root.platform].append(integration.root)
+
+        async with TaskGroup() as tg:
+            for platform, crawler in self._crawlers.items():
+                tg.create_task(crawler.index_integrations(integrations[platform]))
+
     def _get_crawler_for_integration(self, integration: AnyIntegration) -> AnyCrawler:
         return self._crawlers[integration.root.platform]
 
+    async def _finalization_worker(
+        self, crawler: AnyCrawler, queue: Queue[FinalizationJob | None]
+    ) -> None:
+        while (job := await queue.get()) is not None:
+            if (
+                self._stopping.is_set()
+                and job.decision == FinalizationDecision.finalize
+            ):
+                job = job._replace(decision=FinalizationDecision.defer)
+            await self._finalize_submission_and_update_db(crawler, *job)
+
     async def _finalize_submission_and_update_db(
         self,
         crawler: AnyCrawler,
         crawled_submission: CrawledSubmission,
         is_first_scan: bool,
+        decision: FinalizationDecision,
+        pending_since: AwareDatetime | None,
     ) -> None:
         if is_first_scan:
             # If first scan of integration, we do not finalize submissions,
@@ -90,9 +399,50 @@ class MainCrawler:
             finalized_submission = crawler.submission_model.from_crawled(
                 crawled_submission
             )
+        elif decision == FinalizationDecision.skip:
+            # Will never be finalized (by the finalization policy). Store the
+            # partial data, and clear the pending mark if there is one.
+            finalized_submission = crawler.submission_model.from_crawled(
+                crawled_submission, finalization_skipped=True
+            )
+        elif decision == FinalizationDecision.defer:
+            # Store the partial data, and mark the submission to be finalized
+            # in a later crawl.
+            if pending_since is not None:
+                return  # already stored as pending
+            finalized_submission = crawler.submission_model.from_crawled(
+                crawled_submission, finalization_pending=True
+            )
         else:
             # If not first scan, finalize submission as usual.
-            finalized_submission = await crawler.finalize_new_submission(
-                crawled_submission
-            )
+            try:
+                finalized_submission = await crawler.finalize_new_submission(
+                    crawled_submission
+                )
+            except RateLimitWaitCancelledError:
+                if not self._stopping.is_set():
+                    raise
+                # Stopped while waiting for a rate limited request: store the
+                # partial data, to be finalized after the restart.
+                if pending_since is None:
+                    await self._db.upsert_submission(
+                        crawler.submission_model.from_crawled(
+                            crawled_submission, finalization_pending=True
+                        )
+                    )
+                return
+            except CancelledError:
+                if self._stopping.is_set() and pending_since is None:
+                    # Shutdown deadline reached while finalizing: store the
+                    # partial data, to be finalized after the restart.
+                    await self._db.upsert_submission(
+                        crawler.submission_model.from_crawled(
+                            crawled_submission, finalization_pending=True
+                        )
+                    )
+                raise
+
+        if pending_since is not None:
+            # Keep the time the pending submission was first seen at.
+            finalized_submission.first_seen_at = pending_since
         await self._db.upsert_submission(finalized_submission)
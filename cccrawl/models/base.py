@@ -1,7 +1,8 @@
 import hashlib
 from abc import abstractmethod
+from collections.abc import Mapping
 from enum import StrEnum
-from typing import NewType, Protocol, runtime_checkable
+from typing import Any, NewType, Protocol, Self, runtime_checkable
 
 from pydantic import BaseModel
 
@@ -21,7 +22,23 @@ class CCBaseModel(BaseModel):
     @property
     @abstractmethod
     def id(self) -> ModelId:
-        """A predictable uid (typically a hash) that represents the object."""
+        """A predictable uid (typically a hash) that represents the object.
+        Implementations cache the id (computed_field with cached_property)."""
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        super().__setattr__(name, value)
+        # The cached id may depend on the assigned field. Note that ids of
+        # models that contain this model (as a field) are not reset.
+        self.__dict__.pop("id", None)
+
+    def model_copy(
+        self, *, update: Mapping[str, Any] | None = None, deep: bool = False
+    ) -> Self:
+        copy = super().model_copy(update=update, deep=deep)
+        if update:
+            # Updated fields are set directly, without __setattr__.
+            copy.__dict__.pop("id", None)
+        return copy
 
     def _hash_tokens(self, *tokens: str | int | HasId) -> str:
         """Returns a predictible and consistant hash that is a direct output
@@ -30,7 +47,9 @@ class CCBaseModel(BaseModel):
         on."""
         hash = hashlib.sha256()
         for token in tokens:
-            token_str = token.id if isinstance(token, HasId) else str(token)
+            # Checked against str and int first: isinstance checks against a
+            # runtime protocol (HasId) are slow.
+            token_str = str(token) if isinstance(token, (str, int)) else token.id
             hash.update(token_str.encode(encoding="utf8"))
         return hash.hexdigest()
 
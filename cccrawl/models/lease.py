@@ -0,0 +1,47 @@
+from datetime import timedelta
+from enum import auto
+from functools import cached_property
+
+from pydantic import AwareDatetime, computed_field
+
+from cccrawl.models.base import CCBaseModel, CCBaseStrEnum, ModelId
+from cccrawl.utils import current_datetime
+
+
+class LeaseKind(CCBaseStrEnum):
+    """What a lease is protecting. Member leases are used as heartbeats of live
+    crawler instances, integration leases guard a single integration from being
+    crawled by more than one instance at a time."""
+
+    member = auto()
+    integration = auto()
+
+
+class Lease(CCBaseModel):
+    """A time limited, exclusive claim of a resource by a single crawler
+    instance. Expired leases are considered free and can be taken over by any
+    other instance."""
+
+    kind: LeaseKind
+    resource: str
+    owner: str
+    expires_at: AwareDatetime
+
+    @computed_field  # type: ignore[misc]
+    @cached_property
+    def id(self) -> ModelId:
+        return ModelId(self._hash_tokens(self.kind.value, self.resource))
+
+    @classmethod
+    def create(
+        cls, kind: LeaseKind, resource: str, owner: str, duration: timedelta
+    ) -> "Lease":
+        return cls(
+            kind=kind,
+            resource=resource,
+            owner=owner,
+            expires_at=current_datetime() + duration,
+        )
+
+    def is_expired(self) -> bool:
+        return self.expires_at <= current_datetime()
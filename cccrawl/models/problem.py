@@ -1,12 +1,41 @@
-from pydantic import HttpUrl, computed_field
+from functools import cached_property
+
+from pydantic import ConfigDict, HttpUrl, computed_field
 
 from cccrawl.models.base import CCBaseModel, ModelId
 
 
 class Problem(CCBaseModel):
+    # Immutable, since instances are shared between submissions (see
+    # ProblemCatalog).
+    model_config = ConfigDict(frozen=True)
+
     problem_url: HttpUrl
 
     @computed_field  # type: ignore[misc]
-    @property
+    @cached_property
     def id(self) -> ModelId:
         return ModelId(self._hash_tokens(str(self.problem_url)))
+
+
+class ProblemCatalog:
+    """Interns problems by URL: all submissions to the same problem share a
+    single Problem instance, so the URL is validated and the id is hashed once
+    per problem (instead of once per crawled submission)."""
+
+    def __init__(self) -> None:
+        self._problems: dict[str, Problem] = {}
+
+    def __len__(self) -> int:
+        return len(self._problems)
+
+    def get(self, problem_url: str) -> Problem:
+        if (problem := self._problems.get(problem_url)) is None:
+            problem = Problem.model_validate({"problem_url": problem_url})
+            self._problems[problem_url] = problem
+            problem.id  # computed (and cached) once, for all submissions
+        return problem
+
+
+# A single catalog is shared by all crawlers in the process.
+problem_catalog = ProblemCatalog()
@@ -0,0 +1,38 @@
+from functools import cached_property
+
+from pydantic import computed_field
+
+from cccrawl.models.base import CCBaseModel, ModelId
+
+
+class TokenBucket(CCBaseModel):
+    """The state of a rate limit that is shared between crawler instances.
+    A bucket holds up to 'limit' tokens, and refills at a rate of 'limit'
+    tokens every 'every' seconds. Every request consumes a single token."""
+
+    key: str
+    tokens: float
+    updated_at: float  # unix timestamp
+
+    @computed_field  # type: ignore[misc]
+    @cached_property
+    def id(self) -> ModelId:
+        return ModelId(self._hash_tokens(self.key))
+
+    @classmethod
+    def full(cls, key: str, limit: int, now: float) -> "TokenBucket":
+        return cls(key=key, tokens=limit, updated_at=now)
+
+    def take(self, limit: int, every: float, now: float) -> float:
+        """Refill the bucket up to the provided time and try to consume a token.
+        Returns zero if a token was consumed, and otherwise the number of
+        seconds to wait until a token becomes available."""
+        rate = limit / every
+        elapsed = max(now - self.updated_at, 0)
+        self.tokens = min(limit, self.tokens + elapsed * rate)
+        self.updated_at = now
+
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / rate
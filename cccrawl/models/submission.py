@@ -52,14 +52,28 @@ class Submission(CrawledSubmission[IntegrationT], Generic[IntegrationT]):
     # A URL pointing to a raw text file with the submission source code.
     raw_code_url: HttpUrl | None = None
 
+    # True if the submission was stored without being finalized (because of
+    # the finalization policy), and should be finalized in a later crawl.
+    finalization_pending: bool = False
+
+    # True if the submission was stored without being finalized, and will not
+    # be finalized (skipped by the finalization policy).
+    finalization_skipped: bool = False
+
     @classmethod
     def from_crawled(
         cls: type[SubmissionT],
         crawled_submission: CrawledSubmission,
         **additional_kwargs,
     ) -> SubmissionT:
+        # Field values are passed as they are (instead of a dump of the crawled
+        # submission), so the nested models (such as interned problems) are
+        # shared, and not validated again.
         return cls(
-            **crawled_submission.model_dump(),
+            **{
+                name: getattr(crawled_submission, name)
+                for name in type(crawled_submission).model_fields
+            },
             first_seen_at=current_datetime(),
             **additional_kwargs,
         )
@@ -1,3 +1,4 @@
+from functools import cached_property
 from typing import NewType
 
 from pydantic import EmailStr, Field, RootModel, computed_field
@@ -15,6 +16,6 @@ class UserConfig(CCBaseModel):
     integrations: list[ModelId]
 
     @computed_field  # type: ignore[misc]
-    @property
+    @cached_property
     def id(self) -> ModelId:
         return ModelId(self._hash_tokens(self.email))
@@ -0,0 +1,73 @@
+from collections.abc import Iterator, Mapping
+from importlib import import_module
+from typing import TYPE_CHECKING, Any, Generic, TypeVar
+
+from cccrawl.models.integration import Platform
+
+if TYPE_CHECKING:
+    from cccrawl.crawlers.base import AnyCrawler
+    from cccrawl.db.base import Database
+    from cccrawl.files.base import FileUploadService
+
+KeyT = TypeVar("KeyT")
+ValueT = TypeVar("ValueT")
+
+
+class LazyRegistry(Generic[KeyT, ValueT]):
+    """Maps keys to objects given by their import path ('module:attribute').
+    The module of an entry is imported only when the entry is first loaded,
+    so a deployment pays only for the implementations it actually uses."""
+
+    def __init__(self, entries: Mapping[KeyT, str]) -> None:
+        self._entries = dict(entries)
+        self._loaded: dict[KeyT, ValueT] = {}
+
+    def __contains__(self, key: object) -> bool:
+        return key in self._entries
+
+    def __iter__(self) -> Iterator[KeyT]:
+        return iter(self._entries)
+
+    def load(self, key: KeyT) -> ValueT:
+        if key not in self._entries:
+            raise ValueError(
+                f"Unknown registry key: {key} "
+                f"(expected one of: {', '.join(map(str, self._entries))})"
+            )
+        if key not in self._loaded:
+            module_name, attribute = self._entries[key].split(":")
+            self._loaded[key] = getattr(import_module(module_name), attribute)
+        return self._loaded[key]
+
+
+crawlers: LazyRegistry[Platform, type["AnyCrawler"]] = LazyRegistry(
+    {
+        Platform.codeforces: "cccrawl.crawlers.codeforces:CodeforcesCrawler",
+        Platform.cses: "cccrawl.crawlers.cses:CsesCrawler",
+    }
+)
+
+databases: LazyRegistry[str, type["Database"]] = LazyRegistry(
+    {
+        "cosmos": "cccrawl.db.cosmos:CosmosDatabase",
+        "sqlite": "cccrawl.db.sqlite:SqliteDatabase",
+    }
+)
+
+file_uploaders: LazyRegistry[str, type["FileUploadService"]] = LazyRegistry(
+    {
+        "itty": "cccrawl.files.itty:IttyUploadService",
+    }
+)
+
+
+def parse_enabled(value: str | None, registry: LazyRegistry[Any, Any]) -> list[str]:
+    """Parse a comma separated list of registry keys (typically read from an
+    environment variable). If no value is provided, all keys are enabled."""
+    if not value:
+        return [str(key) for key in registry]
+
+    keys = [key.strip() for key in value.split(",") if key.strip()]
+    if unknown := [key for key in keys if key not in registry]:
+        raise ValueError(f"Unknown registry keys: {', '.join(unknown)}")
+    return keys
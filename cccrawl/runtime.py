@@ -0,0 +1,139 @@
+import asyncio
+import inspect
+import statistics
+import sys
+import threading
+import time
+import traceback
+from collections.abc import Coroutine
+from logging import getLogger
+from types import FrameType, TracebackType
+from typing import Any, Self, TypeVar
+
+ResultT = TypeVar("ResultT")
+
+logger = getLogger(__name__)
+
+
+def run(main: Coroutine[Any, Any, ResultT], use_uvloop: bool = True) -> ResultT:
+    """Run the provided coroutine until completion, on a uvloop event loop if
+    uvloop is installed (and enabled), and on the default loop otherwise."""
+    if use_uvloop:
+        try:
+            import uvloop  # type: ignore[import]
+        except ImportError:
+            logger.info("uvloop is not installed, using the default event loop")
+        else:
+            with asyncio.Runner(loop_factory=uvloop.new_event_loop) as runner:
+                return runner.run(main)
+
+    return asyncio.run(main)
+
+
+class LoopLagMonitor:
+    """Measures the scheduling delay of the event loop, by sleeping for a fixed
+    interval and comparing the actual wake up time to the expected one.
+    Percentiles of the delay are logged periodically.
+
+    A watchdog thread detects long stalls while they happen, and logs the stack
+    of the event loop thread, naming the coroutine that blocks the loop."""
+
+    def __init__(
+        self,
+        interval: float = 0.1,
+        report_every: float = 60,
+        stall_threshold: float = 0.5,
+    ) -> None:
+        self._interval = interval
+        self._report_every = report_every
+        self._stall_threshold = stall_threshold
+        self._samples: list[float] = []
+        self._last_tick = time.monotonic()
+        self._loop_thread_id = threading.get_ident()
+        self._sampler: asyncio.Task[None] | None = None
+        self._watchdog: threading.Thread | None = None
+        self._stopped = threading.Event()
+
+    async def __aenter__(self) -> Self:
+        self._loop_thread_id = threading.get_ident()
+        self._last_tick = time.monotonic()
+        self._stopped.clear()
+        self._sampler = asyncio.create_task(self._sample_forever())
+        self._watchdog = threading.Thread(
+            target=self._watch, name="loop-lag-watchdog", daemon=True
+        )
+        self._watchdog.start()
+        return self
+
+    async def __aexit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        self._stopped.set()
+        if self._sampler is not None:
+            self._sampler.cancel()
+            self._sampler = None
+        self._report()
+
+    async def _sample_forever(self) -> None:
+        loop = asyncio.get_running_loop()
+        next_report = loop.time() + self._report_every
+        while True:
+            expected = loop.time() + self._interval
+            await asyncio.sleep(self._interval)
+            now = loop.time()
+            self._samples.append(max(now - expected, 0))
+            self._last_tick = time.monotonic()
+
+            if now >= next_report:
+                self._report()
+                next_report = now + self._report_every
+
+    def _report(self) -> None:
+        if len(self._samples) < 2:
+            return
+
+        percentiles = statistics.quantiles(self._samples, n=100, method="inclusive")
+        logger.info(
+            "Event loop lag: p50=%.1fms p90=%.1fms p99=%.1fms max=%.1fms (%d samples)",
+            percentiles[49] * 1000,
+            percentiles[89] * 1000,
+            percentiles[98] * 1000,
+            max(self._samples) * 1000,
+            len(self._samples),
+        )
+        self._samples.clear()
+
+    def _watch(self) -> None:
+        reported_tick = None
+        while not self._stopped.wait(self._stall_threshold / 2):
+            last_tick = self._last_tick
+            stalled_for = time.monotonic() - last_tick - self._interval
+            if stalled_for < self._stall_threshold or reported_tick == last_tick:
+                continue
+
+            reported_tick = last_tick  # report every stall only once
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+
+            logger.warning(
+                "Event loop stalled for %.2fs, running coroutine: %s\n%s",
+                stalled_for,
+                self._get_running_coroutine(frame),
+                "".join(traceback.format_stack(frame)),
+            )
+
+    @staticmethod
+    def _get_running_coroutine(frame: FrameType) -> str | None:
+        """Returns the name of the outermost coroutine in the stack, which is the
+        coroutine of the task that is blocking the loop."""
+        name = None
+        current: FrameType | None = frame
+        while current is not None:
+            if current.f_code.co_flags & inspect.CO_COROUTINE:
+                name = current.f_code.co_qualname
+            current = current.f_back
+        return name
@@ -0,0 +1,167 @@
+import asyncio
+import hashlib
+import os
+import socket
+from bisect import bisect
+from collections.abc import Iterable
+from datetime import timedelta
+from logging import getLogger
+from types import TracebackType
+
+from cccrawl.db.base import Database
+from cccrawl.models.any_integration import AnyIntegration
+from cccrawl.models.lease import Lease, LeaseKind
+
+logger = getLogger(__name__)
+
+
+def _hash_to_int(token: str) -> int:
+    return int(hashlib.sha256(token.encode(encoding="utf8")).hexdigest()[:16], 16)
+
+
+class HashRing:
+    """A consistent hashing ring. Each member is placed on the ring multiple
+    times (virtual nodes), so that keys are spread evenly between members, and
+    only a small fraction of the keys move when a member joins or leaves."""
+
+    def __init__(self, members: Iterable[str], replicas: int = 64) -> None:
+        self._members = frozenset(members)
+        self._ring = sorted(
+            (_hash_to_int(f"{member}:{replica}"), member)
+            for member in self._members
+            for replica in range(replicas)
+        )
+        self._points = [point for point, _ in self._ring]
+
+    @property
+    def members(self) -> frozenset[str]:
+        return self._members
+
+    def get_owner(self, key: str) -> str | None:
+        if not self._ring:
+            return None
+        index = bisect(self._points, _hash_to_int(key)) % len(self._ring)
+        return self._ring[index][1]
+
+
+class ShardCoordinator:
+    """Partitions integrations between several crawler instances that share the
+    same database.
+
+    Each instance periodically renews a 'member' lease, which doubles as a
+    heartbeat. Integrations are assigned to live members by consistent hashing
+    of the integration id, and an instance must also hold an 'integration'
+    lease while crawling, so that no integration is crawled twice at the same
+    time while the membership changes. If an instance dies, its member lease
+    expires and its integrations are picked up by the remaining instances."""
+
+    def __init__(
+        self,
+        db: Database,
+        owner: str | None = None,
+        heartbeat_every: timedelta = timedelta(seconds=30),
+        member_timeout: timedelta = timedelta(minutes=2),
+        integration_lease_duration: timedelta = timedelta(minutes=30),
+    ) -> None:
+        self._db = db
+        self._owner = owner or f"{socket.gethostname()}-{os.getpid()}"
+        self._heartbeat_every = heartbeat_every
+        self._member_timeout = member_timeout
+        self._integration_lease_duration = integration_lease_duration
+        self._ring = HashRing([self._owner])
+        self._heartbeat_task: asyncio.Task[None] | None = None
+
+    @property
+    def owner(self) -> str:
+        return self._owner
+
+    async def __aenter__(self) -> "ShardCoordinator":
+        await self.heartbeat()
+        self._heartbeat_task = asyncio.create_task(self._heartbeat_forever())
+        return self
+
+    async def __aexit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        if self._heartbeat_task is not None:
+            self._heartbeat_task.cancel()
+            self._heartbeat_task = None
+        await self._db.release_lease(self._member_lease())
+
+    async def heartbeat(self) -> None:
+        """Renew the membership lease of this instance, and rebuild the ring
+        from all instances that are currently alive."""
+        await self._db.acquire_lease(self._member_lease())
+
+        members = {self._owner}
+        async for lease in self._db.get_active_leases(LeaseKind.member):
+            members.add(lease.owner)
+
+        if members != self._ring.members:
+            logger.info("Crawler cluster membership changed: %s", sorted(members))
+            self._ring = HashRing(members)
+
+    async def claim(
+        self, integration: AnyIntegration, assigned_only: bool = True
+    ) -> Lease | None:
+        """Returns a lease on the provided integration, if it is assigned to
+        this instance and no other instance is currently crawling it. If not
+        'assigned_only', integrations of other instances may be claimed too
+        (used for crawls that were requested from this instance)."""
+        if assigned_only and self._ring.get_owner(integration.root.id) != self._owner:
+            return None
+
+        lease = Lease.create(
+            kind=LeaseKind.integration,
+            resource=integration.root.id,
+            owner=self._owner,
+            duration=self._integration_lease_duration,
+        )
+        if not await self._db.acquire_lease(lease):
+            return None
+        return lease
+
+    async def release(self, lease: Lease) -> None:
+        await self._db.release_lease(lease)
+
+    async def keep_alive(self, lease: Lease) -> None:
+        """Renew the provided integration lease periodically, until cancelled.
+        Should run for as long as the integration is crawled, since crawls may
+        outlive the lease duration. Returns if the lease was taken by another
+        crawler instance, in which case the crawl should stop."""
+        while True:
+            await asyncio.sleep(self._integration_lease_duration.total_seconds() / 3)
+            renewed = Lease.create(
+                kind=lease.kind,
+                resource=lease.resource,
+                owner=lease.owner,
+                duration=self._integration_lease_duration,
+            )
+            try:
+                if not await self._db.acquire_lease(renewed):
+                    logger.warning(
+                        "Lease of integration %s was taken by another crawler",
+                        lease.resource,
+                    )
+                    return
+            except Exception:
+                logger.error("Failed to renew integration lease", exc_info=True)
+
+    def _member_lease(self) -> Lease:
+        return Lease.create(
+            kind=LeaseKind.member,
+            resource=self._owner,
+            owner=self._owner,
+            duration=self._member_timeout,
+        )
+
+    async def _heartbeat_forever(self) -> None:
+        while True:
+            await asyncio.sleep(self._heartbeat_every.total_seconds())
+            try:
+                await self.heartbeat()
+            except Exception:
+                logger.error("Failed to renew crawler membership", exc_info=True)
@@ -0,0 +1,126 @@
+import logging
+import queue
+import threading
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any
+
+LOG_FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+
+
+def fields(**values: Any) -> dict[str, Any]:
+    """Structured fields of a log record, to be passed as the 'extra' argument
+    of a logging call. For example:
+    logger.info("Upserted submission", extra=fields(id=submission.id))"""
+    return {"fields": values}
+
+
+class StructuredFormatter(logging.Formatter):
+    """Formats the structured fields of a record (see fields) as compact
+    key=value pairs, that follow the message."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        message = super().format(record)
+        values: dict[str, Any] | None = getattr(record, "fields", None)
+        if not values:
+            return message
+
+        pairs = " ".join(f"{key}={value}" for key, value in values.items())
+        first_line, newline, rest = message.partition("\n")  # before traceback
+        return f"{first_line} {pairs}{newline}{rest}"
+
+
+class _Window:
+    __slots__ = ("started_at", "count", "suppressed")
+
+    def __init__(self, started_at: float) -> None:
+        self.started_at = started_at
+        self.count = 0
+        self.suppressed = 0
+
+
+class RateLimitFilter(logging.Filter):
+    """Passes at most 'burst' records of every message template (per logger) in
+    every interval. Further records are dropped, and their number is reported
+    (as the 'suppressed' field) by the first record of the same template in a
+    later interval. Warnings and errors are never dropped."""
+
+    # Windows are cleaned up once there are more templates than this.
+    MAX_WINDOWS = 1024
+
+    def __init__(self, burst: int = 20, interval: float = 60) -> None:
+        super().__init__()
+        self._burst = burst
+        self._interval = interval
+        self._windows: dict[tuple[str, object], _Window] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+
+        key = (record.name, record.msg)
+        now = time.monotonic()
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None or now - window.started_at >= self._interval:
+                if window is not None and window.suppressed:
+                    record.fields = {
+                        **getattr(record, "fields", {}),
+                        "suppressed": window.suppressed,
+                    }
+                window = self._windows[key] = _Window(now)
+                if len(self._windows) > self.MAX_WINDOWS:
+                    self._remove_expired_windows(now)
+
+            window.count += 1
+            if window.count > self._burst:
+                window.suppressed += 1
+                return False
+        return True
+
+    def _remove_expired_windows(self, now: float) -> None:
+        self._windows = {
+            key: window
+            for key, window in self._windows.items()
+            if now - window.started_at < self._interval
+        }
+
+
+class _DeferredQueueHandler(QueueHandler):
+    """Enqueues records as they are: unlike QueueHandler, the message is not
+    formatted by the logging thread, but by the listener thread. Arguments of
+    logging calls should therefore not be mutated after they are logged."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+@contextmanager
+def queued_logging(
+    level: int = logging.INFO, burst: int = 20, interval: float = 60
+) -> Iterator[None]:
+    """Configure the root logger to hand records over to a queue, which is
+    drained (formatted and written to stderr) by a background thread, so that
+    logging does not block the event loop. High frequency messages are rate
+    limited (see RateLimitFilter). All queued records are written on exit."""
+    log_queue: queue.SimpleQueue[logging.LogRecord] = queue.SimpleQueue()
+
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(StructuredFormatter(LOG_FORMAT))
+    listener = QueueListener(log_queue, stream_handler)
+
+    queue_handler = _DeferredQueueHandler(log_queue)
+    queue_handler.addFilter(RateLimitFilter(burst=burst, interval=interval))
+
+    root_logger = logging.getLogger()
+    root_logger.addHandler(queue_handler)
+    root_logger.setLevel(level)
+    listener.start()
+    try:
+        yield
+    finally:
+        root_logger.removeHandler(queue_handler)
+        listener.stop()
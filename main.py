@@ -1,23 +1,40 @@
 import asyncio
 import logging
 import os
+import signal
+from collections.abc import Coroutine
+from contextlib import AsyncExitStack
+from typing import Any
 
-import httpx
-from azure.cosmos.aio import CosmosClient
 from dotenv import load_dotenv
 
-from cccrawl.crawlers.codeforces import CodeforcesCrawler
-from cccrawl.crawlers.cses import CsesCrawler, CsesCredentials
+from cccrawl import registry, runtime
+from cccrawl.control import ControlServer
 from cccrawl.crawlers.toolkit import CrawlerToolkit
-from cccrawl.db.cosmos import CosmosDatabase
-from cccrawl.files.itty import IttyUploadService
+from cccrawl.crawlers.toolkit.archive import ResponseArchive
+from cccrawl.crawlers.toolkit.http import HttpClientPool
+from cccrawl.crawlers.toolkit.limits import (
+    DatabaseRateLimitBackend,
+    FileRateLimitBackend,
+    RateLimitBackend,
+    set_rate_limit_backend,
+    set_rate_limits_enabled,
+)
+from cccrawl.crawlers.toolkit.parsing import ParsingExecutor
+from cccrawl.db.base import Database
+from cccrawl.finalization import (
+    FinalizationPolicy,
+    FinalizeAccepted,
+    FinalizeAll,
+    FinalizeLatestAccepted,
+    FinalizeWithinBudget,
+)
 from cccrawl.manager import MainCrawler
 from cccrawl.models.integration import Platform
+from cccrawl.sharding import ShardCoordinator
+from cccrawl.utils.logs import queued_logging
 
-logging.basicConfig()
-
-logger = logging.getLogger()
-logger.setLevel(logging.INFO)
+logger = logging.getLogger(__name__)
 
 # Disable info logs for azure cosmos, they are annoying!
 azure_logger = logging.getLogger("azure.core.pipeline.policies.http_logging_policy")
@@ -26,34 +43,183 @@ azure_logger.setLevel(logging.WARNING)
 load_dotenv()
 
 
+def getenv_flag(name: str) -> bool:
+    """Parse a boolean environment variable. Unset (or empty) is False."""
+    value = os.getenv(name, default="").strip().lower()
+    if value in ("", "0", "false", "no", "off"):
+        return False
+    if value in ("1", "true", "yes", "on"):
+        return True
+    raise ValueError(f"Invalid boolean value for {name}: {value!r}")
+
+
+def create_rate_limit_backend(db: Database) -> RateLimitBackend | None:
+    # Rate limits should be shared when several crawler instances use the
+    # same egress IP, otherwise each instance is limited independently.
+    match os.getenv("RATE_LIMIT_BACKEND", default="local"):
+        case "database":
+            return DatabaseRateLimitBackend(db)
+        case "file":
+            path = os.getenv("RATE_LIMIT_FILE", default="cccrawl-rate-limits.json")
+            return FileRateLimitBackend(path)
+        case _:
+            return None
+
+
+def create_finalization_policy() -> FinalizationPolicy:
+    policy: FinalizationPolicy
+    match os.getenv("FINALIZATION_POLICY", default="all"):
+        case "accepted":
+            policy = FinalizeAccepted()
+        case "latest-accepted":
+            policy = FinalizeLatestAccepted()
+        case _:
+            policy = FinalizeAll()
+
+    if budget := os.getenv("FINALIZATION_BUDGET"):
+        # Maximal number of finalized submissions per crawl of an integration.
+        policy = FinalizeWithinBudget(int(budget), policy)
+    return policy
+
+
+async def run_until_stopped(
+    main_crawler: MainCrawler, work: Coroutine[Any, Any, None], timeout: float
+) -> None:
+    """Run the provided work of the crawler. On SIGTERM (or SIGINT), the crawler
+    is stopped gracefully (see MainCrawler.stop), and cancelled if it does not
+    stop within the timeout (or on a second signal)."""
+    loop = asyncio.get_running_loop()
+    task = asyncio.create_task(work)
+    deadline: asyncio.TimerHandle | None = None
+
+    def on_signal() -> None:
+        nonlocal deadline
+        if deadline is None:
+            main_crawler.stop()
+            deadline = loop.call_later(timeout, task.cancel)
+        else:
+            task.cancel()
+
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(signum, on_signal)
+    try:
+        await task
+    except asyncio.CancelledError:
+        current_task = asyncio.current_task()
+        if deadline is None or (current_task and current_task.cancelling()):
+            raise
+        logger.warning("Crawler did not stop within %ss, cancelled", timeout)
+    finally:
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            loop.remove_signal_handler(signum)
+        if deadline is not None:
+            deadline.cancel()
+
+
 async def main():
-    async with httpx.AsyncClient() as http_client:
+    # Only the enabled platforms and backends are imported (see registry).
+    platforms = registry.parse_enabled(
+        os.getenv("ENABLED_PLATFORMS"), registry.crawlers
+    )
+    database_cls = registry.databases.load(
+        os.getenv("DATABASE_BACKEND", default="cosmos")
+    )
+    file_uploader_cls = registry.file_uploaders.load(
+        os.getenv("FILE_UPLOAD_BACKEND", default="itty")
+    )
+    crawler_classes = {
+        platform: registry.crawlers.load(platform)
+        for platform in map(Platform, platforms)
+    }
+
+    # In reprocess mode, the crawlers re-parse archived responses (instead of
+    # fetching from the network), and update all stored submissions.
+    reprocess = os.getenv("CRAWLER_MODE") == "reprocess"
+    archive = None
+    if archive_path := os.getenv("ARCHIVE_PATH"):
+        archive = ResponseArchive(archive_path)
+    if reprocess:
+        # No requests reach the judges, so there is nothing to rate limit.
+        set_rate_limits_enabled(False)
+
+    async with HttpClientPool(
+        {
+            platform: crawler_cls.http_client_settings
+            for platform, crawler_cls in crawler_classes.items()
+        },
+        archive=archive,
+        replay=reprocess,
+    ) as http_clients, ParsingExecutor(
+        max_workers=int(os.getenv("PARSER_WORKERS", default="2")),
+        use_processes=getenv_flag("PARSER_USE_PROCESSES"),
+    ) as parser:
         toolkit = CrawlerToolkit(
-            client=http_client,
-            file_uploader=IttyUploadService(key_length=16),
+            clients=http_clients,
+            file_uploader=file_uploader_cls.from_env(http_clients.get()),
+            parser=parser,
         )
 
         crawlers_mapping = {
-            Platform.cses: CsesCrawler(
-                toolkit=toolkit,
-                credentials=CsesCredentials(
-                    username=os.getenv("CSES_USERNAME"),
-                    password=os.getenv("CSES_PASSWORD"),
-                ),
-            ),
-            Platform.codeforces: CodeforcesCrawler(
-                toolkit=toolkit,
-            ),
+            platform: crawler_cls.from_env(toolkit)
+            for platform, crawler_cls in crawler_classes.items()
         }
 
-        async with CosmosClient(
-            os.getenv("COSMOS_ENDPOINT"), os.getenv("COSMOS_KEY")
-        ) as cosmos_client:
-            db = await CosmosDatabase.init_database(cosmos_client)
-            await MainCrawler(
+        async with AsyncExitStack() as stack:
+            if not getenv_flag("LOOP_LAG_MONITOR_DISABLED"):
+                await stack.enter_async_context(
+                    runtime.LoopLagMonitor(
+                        stall_threshold=float(
+                            os.getenv("LOOP_STALL_THRESHOLD", default="0.5")
+                        ),
+                    )
+                )
+            if archive is not None:
+                stack.callback(archive.close)
+            db = await stack.enter_async_context(database_cls.open_from_env())
+            set_rate_limit_backend(create_rate_limit_backend(db))
+
+            shards = None
+            if getenv_flag("SHARDING_ENABLED") and not reprocess:
+                # Partition integrations between all crawler instances that
+                # share the same database.
+                shards = await stack.enter_async_context(ShardCoordinator(db))
+
+            main_crawler = MainCrawler(
                 db=db,
                 crawlers=crawlers_mapping,
-            ).crawl()
+                shards=shards,
+                finalization_policy=create_finalization_policy(),
+                max_concurrent_finalizations=int(
+                    os.getenv("MAX_CONCURRENT_FINALIZATIONS", default="16")
+                ),
+            )
+            stack.push_async_callback(main_crawler.close)
+
+            # Time to finish the current integration after SIGTERM. Should be
+            # shorter than the grace period of the container runtime (10s for
+            # docker stop, by default).
+            shutdown_timeout = float(os.getenv("SHUTDOWN_TIMEOUT", default="8"))
+
+            if reprocess:
+                await run_until_stopped(
+                    main_crawler, main_crawler.reprocess(), shutdown_timeout
+                )
+                return
+
+            if control_address := os.getenv("CONTROL_API_ADDRESS"):
+                # For example '127.0.0.1:8370', or 'unix:/run/cccrawl.sock'.
+                await stack.enter_async_context(
+                    ControlServer(main_crawler, control_address)
+                )
+            await run_until_stopped(
+                main_crawler, main_crawler.crawl(), shutdown_timeout
+            )
 
 
-asyncio.run(main())
+if __name__ == "__main__":
+    # Records are written by a background thread, and frequent messages are
+    # rate limited (at most LOG_BURST records of every message per minute).
+    with queued_logging(
+        level=logging.INFO, burst=int(os.getenv("LOG_BURST", default="20"))
+    ):
+        runtime.run(main(), use_uvloop=not getenv_flag("UVLOOP_DISABLED"))
@@ -0,0 +1,163 @@
+import asyncio
+import json
+from pathlib import Path
+
+from httpx import AsyncClient, Request, Response
+
+from cccrawl.crawlers.codeforces import CodeforcesCrawler, CodeforcesDiscoveryMode
+from cccrawl.crawlers.toolkit import CrawlerToolkit
+from cccrawl.crawlers.toolkit.archive import ReplayTransport, ResponseArchive
+from cccrawl.crawlers.toolkit.limits import set_rate_limits_enabled
+from cccrawl.crawlers.toolkit.parsing import ParsingExecutor
+from cccrawl.integrations.codeforces import CodeforcesIntegration
+from cccrawl.models.submission import SubmissionVerdict
+
+FIXTURES = Path(__file__).resolve().parent / "fixtures" / "codeforces"
+
+RECENT_STATUS_URL = "https://codeforces.com/api/problemset.recentStatus"
+USER_STATUS_URL = "https://codeforces.com/api/user.status"
+
+# Handles of the crawled integrations. Others (such as carol, who appears in
+# the feed) are not crawled by this instance.
+HANDLES = ["alice", "bob", "dave"]
+
+
+class CountingReplayTransport(ReplayTransport):
+    """Replays archived responses, and counts the downloaded histories."""
+
+    def __init__(self, archive: ResponseArchive) -> None:
+        super().__init__(archive)
+        self.downloaded_histories: list[str] = []
+
+    async def handle_async_request(self, request: Request) -> Response:
+        if request.url.path.endswith("user.status"):
+            self.downloaded_histories.append(request.url.params["handle"])
+        return await super().handle_async_request(request)
+
+
+class ReplayClients:
+    """Serves all platforms from the archive (see HttpClientPool). Not in
+    replay mode, since the feed itself is tested."""
+
+    replay = False
+
+    def __init__(self, transport: ReplayTransport) -> None:
+        self._client = AsyncClient(transport=transport)
+
+    def get(self, platform: object = None) -> AsyncClient:
+        return self._client
+
+
+async def record(archive: ResponseArchive, url: str, params: dict, content: bytes):
+    await archive.append(
+        Request("GET", url, params=params), Response(200, content=content)
+    )
+
+
+async def record_recent_status(archive: ResponseArchive, fixture: str) -> None:
+    content = (FIXTURES / fixture).read_bytes()
+    await record(archive, RECENT_STATUS_URL, {"count": 1000}, content)
+
+
+async def crawl_all(crawler: CodeforcesCrawler) -> None:
+    for handle in HANDLES:
+        integration = CodeforcesIntegration(handle=handle)
+        if not await crawler.should_crawl(integration):
+            continue
+        async for _ in crawler.crawl(integration):
+            pass
+
+
+async def replay_feed(archive_path: Path) -> None:
+    archive = ResponseArchive(archive_path)
+    for handle in HANDLES:
+        await record(
+            archive,
+            USER_STATUS_URL,
+            {"handle": handle, "from": 1},
+            b'{"status": "OK", "result": []}',
+        )
+
+    transport = CountingReplayTransport(archive)
+    async with ParsingExecutor(max_workers=0) as parser:
+        toolkit = CrawlerToolkit(ReplayClients(transport), None, parser)  # type: ignore[arg-type]
+        crawler = CodeforcesCrawler(toolkit, CodeforcesDiscoveryMode.feed)
+
+        # First crawl: histories of all users are downloaded (and indexed).
+        await crawl_all(crawler)
+        assert transport.downloaded_histories == HANDLES
+
+        # The first poll can not tell which submissions are new (the feed has a
+        # gap), so all crawled users are marked dirty, and swept again.
+        await record_recent_status(archive, "recent_status_1.json")
+        await crawler._poll_recent_status()
+        assert crawler._dirty_handles == set(HANDLES)
+        transport.downloaded_histories.clear()
+        await crawl_all(crawler)
+        assert transport.downloaded_histories == HANDLES
+        assert not crawler._dirty_handles
+
+        # The second poll overlaps the first one. Alice has a new submission,
+        # and the submission of Bob that was being judged has a verdict now.
+        # Dave does not appear in the new submissions, and is not swept.
+        await record_recent_status(archive, "recent_status_2.json")
+        await crawler._poll_recent_status()
+        assert crawler._dirty_handles == {"alice", "bob"}
+        transport.downloaded_histories.clear()
+        await crawl_all(crawler)
+        assert transport.downloaded_histories == ["alice", "bob"]
+        assert not crawler._dirty_handles
+
+    archive.close()
+
+
+def test_feed_marks_dirty_handles(tmp_path: Path) -> None:
+    set_rate_limits_enabled(False)  # requests do not reach the network
+    try:
+        asyncio.run(replay_feed(tmp_path / "archive"))
+    finally:
+        set_rate_limits_enabled(True)
+
+
+def history(verdict: str) -> bytes:
+    submission = {
+        "id": 250000105,
+        "creationTimeSeconds": 1700000405,
+        "problem": {"contestId": 1900, "index": "A"},
+        "verdict": verdict,
+    }
+    return json.dumps({"status": "OK", "result": [submission]}).encode()
+
+
+async def replay_judging(archive_path: Path) -> list[SubmissionVerdict]:
+    archive = ResponseArchive(archive_path)
+    params = {"handle": "alice", "from": 1}
+    await record(archive, USER_STATUS_URL, params, history("TESTING"))
+
+    transport = CountingReplayTransport(archive)
+    async with ParsingExecutor(max_workers=0) as parser:
+        toolkit = CrawlerToolkit(ReplayClients(transport), None, parser)  # type: ignore[arg-type]
+        crawler = CodeforcesCrawler(toolkit, CodeforcesDiscoveryMode.activity)
+        integration = CodeforcesIntegration(handle="alice")
+
+        # A submission that is still being judged is not yielded, and the
+        # history is downloaded again on the next crawl (with no activity check).
+        assert await crawler.should_crawl(integration)
+        assert [sub async for sub in crawler.crawl(integration)] == []
+        assert await crawler.should_crawl(integration)
+
+        await record(archive, USER_STATUS_URL, params, history("OK"))
+        verdicts = [sub.verdict async for sub in crawler.crawl(integration)]
+        assert not crawler._dirty_handles
+
+    archive.close()
+    return verdicts
+
+
+def test_unjudged_submissions_are_deferred(tmp_path: Path) -> None:
+    set_rate_limits_enabled(False)  # requests do not reach the network
+    try:
+        verdicts = asyncio.run(replay_judging(tmp_path / "archive"))
+    finally:
+        set_rate_limits_enabled(True)
+    assert verdicts == [SubmissionVerdict.accepted]
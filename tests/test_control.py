@@ -0,0 +1,58 @@
+import asyncio
+from typing import Any
+
+from httpx import AsyncClient
+
+from cccrawl.control import ControlServer
+from cccrawl.db.sqlite import SqliteDatabase
+from cccrawl.manager import MainCrawler
+
+
+async def request(method: str, path: str) -> tuple[int, Any]:
+    crawler = MainCrawler(db=SqliteDatabase(":memory:"), crawlers={})
+    control = ControlServer(crawler, "127.0.0.1:0")
+
+    # Serves the handler of the control server on a free port.
+    server = await asyncio.start_server(control._handle, "127.0.0.1", 0)
+    host, port = server.sockets[0].getsockname()[:2]
+    try:
+        async with AsyncClient(base_url=f"http://{host}:{port}") as client:
+            crawler.request_crawl("first")  # type: ignore[arg-type]
+            response = await client.request(method, path)
+            return response.status_code, response.json()
+    finally:
+        server.close()
+        await server.wait_closed()
+
+
+def test_status() -> None:
+    status, body = asyncio.run(request("GET", "/status"))
+    assert status == 200
+    assert body == {
+        "current_integration": None,
+        "current_since": None,
+        "requested_integrations": ["first"],
+        "processed_integrations": 0,
+        "requested_crawls": 0,
+    }
+
+
+def test_request_crawl_returns_queue_position() -> None:
+    status, body = asyncio.run(request("POST", "/crawl/second"))
+    assert status == 202
+    assert body == {"integration": "second", "position": 2}
+
+
+def test_query_string_is_ignored() -> None:
+    status, _ = asyncio.run(request("GET", "/status?verbose=1"))
+    assert status == 200
+
+
+def test_wrong_method() -> None:
+    assert asyncio.run(request("POST", "/status"))[0] == 405
+    assert asyncio.run(request("GET", "/crawl/second"))[0] == 405
+
+
+def test_unknown_route() -> None:
+    assert asyncio.run(request("GET", "/crawl"))[0] == 404
+    assert asyncio.run(request("GET", "/nope"))[0] == 404
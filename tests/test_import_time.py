@@ -0,0 +1,50 @@
+import re
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# Maximal time (in seconds) to import main.py, before any crawler or backend
+# is loaded from the registries. About 0.35s when measured, the budget leaves
+# room for slower machines.
+IMPORT_TIME_BUDGET = 1.0
+
+# Heavy dependencies that must be imported only by the crawlers and backends
+# that use them (see cccrawl.registry).
+LAZY_DEPENDENCIES = ("azure", "bs4", "lxml")
+
+IMPORT_TIME_LINE = re.compile(r"import time:\s+\d+ \|\s+(\d+) \|( *)(\S+)")
+
+
+def import_main() -> dict[str, float]:
+    """Import main.py in a new interpreter, and return the cumulative import
+    time (in seconds) of every module it imported."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return {
+        match[3]: int(match[1]) / 1_000_000
+        for match in IMPORT_TIME_LINE.finditer(result.stderr)
+    }
+
+
+def test_import_time_within_budget() -> None:
+    import_main()  # compile the bytecode caches first
+    import_times = import_main()
+    assert import_times["main"] < IMPORT_TIME_BUDGET
+
+
+def test_heavy_dependencies_are_imported_lazily() -> None:
+    modules = import_main()
+    for dependency in LAZY_DEPENDENCIES:
+        imported = [
+            module
+            for module in modules
+            if module == dependency or module.startswith(f"{dependency}.")
+        ]
+        assert not imported, f"{dependency} is imported eagerly"